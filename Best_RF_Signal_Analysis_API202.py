@@ -3,34 +3,3386 @@
 ## python file in the following directory and restart QGIS
 ## C:\Users\[your usesrname]\AppData\Roaming\QGIS\QGIS3\profiles\default\processing\scripts
 
-from qgis.PyQt.QtCore import QCoreApplication
-from qgis.core import (QgsSymbol,
-                       QgsProject,
-                       QgsProcessing,
-                       QgsRendererRange,
-                       QgsProcessingUtils,
-                       QgsPalLayerSettings,
-                       QgsTextBufferSettings,
-                       QgsProcessingException,
-                       QgsProcessingAlgorithm,
-                       QgsSvgMarkerSymbolLayer,
-                       QgsGraduatedSymbolRenderer,
-                       QgsProcessingParameterField,
-                       QgsProcessingParameterString,
-                       QgsCoordinateReferenceSystem,
-                       QgsVectorLayerSimpleLabeling,
-                       QgsProcessingMultiStepFeedback,
-                       QgsProcessingParameterDefinition,
-                       QgsProcessingParameterFeatureSink,
-                       QgsProcessingParameterFeatureSource)
-from qgis import processing
-from PyQt5 import QtGui
+# The QGIS modules are only needed by the processing algorithm, the analysis
+# itself also runs from the command line in a plain Python environment
+try:
+    from qgis.PyQt.QtCore import QCoreApplication, QVariant
+    from qgis.core import (QgsField,
+                           QgsFields,
+                           QgsPoint,
+                           QgsSymbol,
+                           QgsFeature,
+                           QgsPointXY,
+                           QgsGeometry,
+                           QgsWkbTypes,
+                           QgsProject,
+                           QgsProcessing,
+                           QgsRendererRange,
+                           QgsProcessingUtils,
+                           QgsPalLayerSettings,
+                           QgsTextBufferSettings,
+                           QgsProcessingException,
+                           QgsProcessingAlgorithm,
+                           QgsSvgMarkerSymbolLayer,
+                           QgsGraduatedSymbolRenderer,
+                           QgsFeatureSink,
+                           QgsFeatureSource,
+                           QgsFeatureRequest,
+                           QgsProcessingContext,
+                           QgsVectorDataProvider,
+                           QgsProcessingParameterField,
+                           QgsProcessingParameterBoolean,
+                           QgsProcessingParameterNumber,
+                           QgsProcessingParameterEnum,
+                           QgsProcessingParameterFile,
+                           QgsProcessingParameterFileDestination,
+                           QgsProcessingParameterString,
+                           QgsCoordinateReferenceSystem,
+                           QgsCoordinateTransform,
+                           QgsVectorLayerSimpleLabeling,
+                           QgsProcessingMultiStepFeedback,
+                           QgsProcessingParameterDefinition,
+                           QgsProcessingParameterFeatureSink,
+                           QgsProcessingParameterFeatureSource)
+    from qgis import processing
+    from PyQt5 import QtGui
+except ImportError:
+    QgsProcessingAlgorithm = object
+
 from pathlib import Path
 
-import requests, csv, sys, os, time, json, glob, traceback, fnmatch, shutil
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from email.utils import parsedate_to_datetime
+from xml.sax.saxutils import quoteattr
+
+from requests.adapters import HTTPAdapter
+
+from array import array
+
+import numpy as np
+import bisect, contextlib, itertools, requests, csv, sys, os, time, json, glob, traceback, fnmatch, shutil, random, socket, threading, heapq, hashlib, re, math, sqlite3, struct, zlib, importlib.util, multiprocessing
+
+# orjson decodes CloudRF responses several times faster than the standard
+# library when it is installed in the QGIS Python environment
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# pyproj transforms whole coordinate arrays to WGS84 at once when it is
+# installed, QGIS transforms are used otherwise
+try:
+    import pyproj
+except ImportError:
+    pyproj = None
+
+# SciPy's KD-tree indexes the tower registry when it is installed, towers are
+# searched in blocks with NumPy otherwise
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# The GDAL Python bindings, shipped with QGIS, write FlatGeobuf outputs
+try:
+    from osgeo import ogr, osr
+except ImportError:
+    ogr = None
+
+# CloudRF server and SSL verification used by the processing algorithm
+server="https://cloudrf.com"
+strictSSL=True
+
+class RequestCanceled(Exception):
+    """
+    Raised by requests given up because the run was canceled.
+    """
+
+
+class CloudRFHTTPError(Exception):
+    """
+    Raised when CloudRF answers a request with an HTTP error status.
+    """
+
+    def __init__(self, status_code, body=''):
+        super().__init__('CloudRF responded with HTTP {}: {}'.format(status_code, body[:200]))
+        self.status_code = status_code
+
+
+class TokenBucketRateLimiter:
+    """
+    Thread safe token bucket shared by all request workers. The rate is halved
+    whenever CloudRF throttles a request and creeps back up to the configured
+    cap with every successful request. A rate of 0 disables the limiter.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.capacity = float(burst or max(1.0, self.max_rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, canceled=None):
+        """
+        Waits for a token. Returns False without one if the canceled event is
+        set while waiting.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    if self.max_rate <= 0:
+                        return True
+                    self.tokens = min(self.capacity, self.tokens + (now-self.updated)*self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return True
+                    delay = (1-self.tokens)/self.rate
+                else:
+                    delay = self.paused_until-now
+            if canceled is None:
+                time.sleep(delay)
+            elif canceled.wait(delay):
+                return False
+
+    def throttle(self, retry_after=None):
+        with self.lock:
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic()+retry_after)
+            if self.max_rate > 0:
+                self.rate = max(self.max_rate/16, self.rate/2)
+                self.tokens = min(self.tokens, 0.0)
+
+    def relax(self):
+        if self.max_rate > 0 and self.rate < self.max_rate:
+            with self.lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate/20)
+
+
+def parse_retry_after(value):
+    """
+    Returns the number of seconds requested by a Retry-After header, which is
+    either a delay in seconds or an HTTP date, or None when it can't be read.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp()-time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class PipelineMetrics:
+    """
+    Thread safe collection of the timings and counters of a run: wall time per
+    phase, a histogram of request latencies, HTTP statuses, retries, response
+    cache and checkpoint hits, and bytes sent and received. The metrics are
+    written with write() as JSON, or as Prometheus text for a .prom file, and
+    passed to the callback, when given, on every report().
+    """
+
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.phases = {}
+        self.counters = {}
+        self.statuses = {}
+        self.latency_counts = [0]*len(self.LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.lap_start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter()-start)
+
+    def lap(self, name=None):
+        """
+        Adds the time since the previous lap to the named phase, or only starts
+        a new lap when no name is given.
+        """
+        now = time.perf_counter()
+        if name is not None:
+            self.add_time(name, now-self.lap_start)
+        self.lap_start = now
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0)+seconds
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0)+value
+
+    def observe_request(self, latency, status, sent=0, received=0):
+        """
+        Records one HTTP request attempt, status is None for connection errors
+        and timeouts.
+        """
+        with self.lock:
+            status = str(status or 'error')
+            self.statuses[status] = self.statuses.get(status, 0)+1
+            self.latency_counts[bisect.bisect_left(self.LATENCY_BUCKETS, latency)] += 1
+            self.latency_sum += latency
+            self.counters['bytes_sent'] = self.counters.get('bytes_sent', 0)+sent
+            self.counters['bytes_received'] = self.counters.get('bytes_received', 0)+received
+
+    def snapshot(self):
+        with self.lock:
+            requests_made = sum(self.latency_counts)
+            hits = self.counters.get('cache_hits', 0)
+            lookups = hits+self.counters.get('cache_misses', 0)
+            return {
+                'elapsed_s': time.time()-self.started,
+                'phases_s': dict(self.phases),
+                'counters': dict(self.counters),
+                'http_statuses': dict(self.statuses),
+                'cache_hit_ratio': hits/lookups if lookups else None,
+                'request_latency': {
+                    'count': requests_made,
+                    'sum_s': self.latency_sum,
+                    'mean_s': self.latency_sum/requests_made if requests_made else None,
+                    'buckets': {'+Inf' if math.isinf(bound) else repr(bound): count for bound, count in zip(self.LATENCY_BUCKETS, itertools.accumulate(self.latency_counts))}
+                }
+            }
+
+    def prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = ['# TYPE best_signal_phase_seconds gauge']
+        lines.extend('best_signal_phase_seconds{{phase="{}"}} {}'.format(name, value) for name, value in sorted(snapshot['phases_s'].items()))
+        lines.append('# TYPE best_signal_total counter')
+        lines.extend('best_signal_total{{counter="{}"}} {}'.format(name, value) for name, value in sorted(snapshot['counters'].items()))
+        lines.append('# TYPE best_signal_http_responses_total counter')
+        lines.extend('best_signal_http_responses_total{{status="{}"}} {}'.format(name, value) for name, value in sorted(snapshot['http_statuses'].items()))
+        if snapshot['cache_hit_ratio'] is not None:
+            lines.append('# TYPE best_signal_cache_hit_ratio gauge')
+            lines.append('best_signal_cache_hit_ratio {}'.format(snapshot['cache_hit_ratio']))
+        lines.append('# TYPE best_signal_request_seconds histogram')
+        for bound, count in snapshot['request_latency']['buckets'].items():
+            lines.append('best_signal_request_seconds_bucket{{le="{}"}} {}'.format(bound, count))
+        lines.append('best_signal_request_seconds_sum {}'.format(snapshot['request_latency']['sum_s']))
+        lines.append('best_signal_request_seconds_count {}'.format(snapshot['request_latency']['count']))
+        return '\n'.join(lines)+'\n'
+
+    def write(self, path):
+        if os.path.splitext(path)[1].lower() in ('.prom', '.txt'):
+            content = self.prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2)
+        temp = '{}.tmp'.format(path)
+        with open(temp, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(content)
+        os.replace(temp, path)
+
+    def report(self, path=None):
+        """
+        Writes the metrics to path, when given, and passes them to the callback.
+        """
+        if path:
+            self.write(path)
+        if self.callback is not None:
+            self.callback(self.snapshot())
+
+
+def tracked_get_conn(self, timeout=None):
+    conn = super(type(self), self)._get_conn(timeout)
+    with self.in_use_lock:
+        self.in_use.add(conn)
+    return conn
+
+
+def tracked_put_conn(self, conn):
+    with self.in_use_lock:
+        self.in_use.discard(conn)
+    super(type(self), self)._put_conn(conn)
+
+
+class AbortableHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that keeps track of the connections checked out of its pools,
+    so abort() can end the requests in flight by shutting their sockets down
+    instead of waiting for their responses or timeouts.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.in_use = set()
+        tracked = {'in_use': self.in_use, 'in_use_lock': threading.Lock(), '_get_conn': tracked_get_conn, '_put_conn': tracked_put_conn}
+        self.poolmanager.pool_classes_by_scheme = {scheme: type(pool.__name__, (pool,), tracked)
+                                                   for scheme, pool in self.poolmanager.pool_classes_by_scheme.items()}
+        self.in_use_lock = tracked['in_use_lock']
+
+    def abort(self):
+        with self.in_use_lock:
+            connections = list(self.in_use)
+        for conn in connections:
+            sock = getattr(conn, 'sock', None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class CloudRFRequestEngine:
+    """
+    Sends CloudRF best server requests over a bounded pool of worker threads.
+    At most two requests per worker are queued or in flight at any time so
+    large civic layers are never turned into futures all at once.
+
+    Requests are paced by a token bucket and requests answered with HTTP 429,
+    a 5xx status or a connection error are retried with exponential backoff
+    and full jitter, honouring Retry-After up to max_retry_after seconds,
+    until either the per request retry limit or the retry budget shared by
+    the whole run is used up.
+
+    All requests go through one pooled keep-alive session, so connections and
+    TLS handshakes are set up once per worker instead of once per civic. Use
+    the engine as a context manager or call close() to release the pool.
+    """
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, server, strict_ssl=True, concurrency=4, rate_limit=4.0, max_retries=5, retry_budget=500, backoff_base=0.5, backoff_cap=60.0,
+                 max_retry_after=300.0, pool_size=None, timeout=120.0, connect_timeout=10.0, gzip=True, limiter=None, slots=None, metrics=None):
+        self.url = server+"/API/network/index.php"
+        self.strict_ssl = strict_ssl
+        self.concurrency = max(1, int(concurrency))
+        self.window = self.concurrency*2
+        self.timeout = (connect_timeout, timeout)
+        self.session = requests.Session()
+        # pool_block keeps the number of open connections at the pool size
+        # when more workers than pooled connections are configured
+        self.adapter = AbortableHTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(pool_size or self.concurrency)), max_retries=0, pool_block=True)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.verify = strict_ssl
+        self.session.headers.update({
+            'Connection': 'keep-alive',
+            'Accept-Encoding': 'gzip, deflate' if gzip else 'identity'
+        })
+        # Engines of a batch share their rate limiter and a semaphore of request
+        # slots so the whole batch stays within one API concurrency budget
+        self.limiter = limiter or TokenBucketRateLimiter(rate_limit)
+        self.slots = slots or contextlib.nullcontext()
+        self.max_retries = max(0, int(max_retries))
+        self.retry_budget = max(0, int(retry_budget))
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+        self.retries = 0
+        self.retry_lock = threading.Lock()
+        self.metrics = metrics
+        self.canceled = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def cancel(self):
+        """
+        Gives up every queued request and every request waiting for a token or
+        a retry, and aborts the requests already sent by shutting down their
+        sockets.
+        """
+        self.canceled.set()
+        self.adapter.abort()
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base*2**attempt))
+
+    def take_retry(self):
+        with self.retry_lock:
+            if self.retries >= self.retry_budget:
+                return False
+            self.retries += 1
+        if self.metrics is not None:
+            self.metrics.count('retries')
+        return True
+
+    def request(self, row):
+        attempt = 0
+        while True:
+            if not self.limiter.acquire(self.canceled) or self.canceled.is_set():
+                raise RequestCanceled()
+            retry_after = None
+            start = time.perf_counter()
+            try:
+                with self.slots:
+                    req = self.session.post(self.url, data=row, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if self.canceled.is_set():
+                    raise RequestCanceled()
+                failure = error
+                if self.metrics is not None:
+                    self.metrics.observe_request(time.perf_counter()-start, None)
+            else:
+                if self.metrics is not None:
+                    # Bytes received on the wire, compressed when gzip was used
+                    self.metrics.observe_request(time.perf_counter()-start, req.status_code, len(req.request.body or ''),
+                                                 int(req.headers.get('Content-Length') or len(req.content)))
+                if req.ok:
+                    self.limiter.relax()
+                    return req.content
+                failure = CloudRFHTTPError(req.status_code, req.text)
+                if req.status_code not in self.RETRY_STATUS:
+                    raise failure
+                # A bad Retry-After header must not hold a worker for hours
+                retry_after = parse_retry_after(req.headers.get('Retry-After'))
+                if retry_after is not None:
+                    retry_after = min(retry_after, self.max_retry_after)
+                if req.status_code == 429:
+                    self.limiter.throttle(retry_after)
+            if attempt >= self.max_retries or not self.take_retry():
+                raise failure
+            if self.canceled.wait(retry_after if retry_after is not None else self.backoff(attempt)):
+                raise RequestCanceled()
+            attempt += 1
+
+    def fetch(self, row, on_response=None):
+        content = self.request(row)
+        if on_response is not None:
+            on_response(row, content)
+        return content
+
+    def run(self, rows, feedback=None, on_response=None):
+        """
+        Requests every row and yields (row, content, error) tuples in the order
+        the responses arrive. Feedback is polled while waiting for responses and
+        once it is canceled the engine is canceled and no more rows are yielded.
+        When given, on_response(row, content) is called from the worker thread
+        as soon as a response is received, before it is yielded.
+        """
+        rows = iter(rows)
+        in_flight = {}
+        exhausted = False
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            while True:
+                while not exhausted and len(in_flight) < self.window:
+                    row = None
+                    if feedback is None or not feedback.isCanceled():
+                        row = next(rows, None)
+                    if row is None:
+                        exhausted = True
+                        break
+                    in_flight[executor.submit(self.fetch, row, on_response)] = row
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, timeout=self.POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                if feedback is not None and feedback.isCanceled():
+                    break
+                for future in done:
+                    row = in_flight.pop(future)
+                    try:
+                        content = future.result()
+                    except Exception as error:
+                        yield row, None, error
+                    else:
+                        yield row, content, None
+        finally:
+            # Left early on cancellation or when the caller stopped iterating,
+            # the aborted workers are waited for so on_response is never
+            # called once run() has returned
+            if in_flight:
+                self.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def format_exception(error, detail=''):
+    """
+    Formats an exception the same way the algorithm reports Python errors to QGIS.
+    """
+    tbinfo = ''.join(traceback.format_tb(error.__traceback__)[:1])
+    return "PYTHON ERRORS:\nTraceback info:\n{}\nError Info:\n{}{}".format(tbinfo, detail, str(error))
+
+
+def append_unique_fields(fields, new_fields):
+    """
+    Appends copies of new_fields to fields, adding a numeric suffix to the name
+    of any field already present, the way QGIS names joined fields.
+    """
+    for new_field in new_fields:
+        field = QgsField(new_field)
+        suffix = 2
+        while fields.lookupField(field.name()) != -1:
+            field.setName('{}_{}'.format(new_field.name(), suffix))
+            suffix += 1
+        fields.append(field)
+
+
+def qgs_fields(definitions, fields=None):
+    """
+    Returns a copy of fields, or new QgsFields, with fields of the given (name,
+    type) definitions appended.
+    """
+    fields = QgsFields() if fields is None else QgsFields(fields)
+    for name, kind in definitions:
+        fields.append(QgsField(name, {str: QVariant.String, float: QVariant.Double, int: QVariant.Int}[kind]))
+    return fields
+
+
+def civic_key(value):
+    """
+    Returns the civic ID used to key requests and results for a civic field value.
+    """
+    if isinstance(value, str):
+        value = value.replace('(','').replace(')','').replace('"','')
+    return '{}'.format(value)
+
+
+# Version of the parse_best_server output kept in the checkpoint store, stored
+# results of another version or number of servers are parsed again
+PARSE_FORMAT = '2'
+
+def parse_best_server(data, network, servers=2):
+    """
+    Parses a decoded CloudRF best server response. Returns the receiver latitude
+    and longitude, the given number of strongest servers sorted from best to
+    weakest signal as (tower name, [signal, chart url, distance, azimuth,
+    downtilt]) tuples and a dictionary of tower name to [longitude, latitude,
+    height].
+    """
+    dict = {}
+    towers = {}
+    for field in data:
+        data_list = []
+        tower_field = field.get('Server name')
+        tower_name = tower_field.split('{}_'.format(network))[1].replace('_',' ').strip()
+        signal_str = field['Transmitters'][0]['Signal power at receiver dBm']
+        data_list.append(signal_str)
+
+        url = field['Chart image']
+        rlat = field['Receiver'][0]['Latitude']
+        rlon = field['Receiver'][0]['Longitude']
+        dis = field['Transmitters'][0]['Distance to receiver km']
+        azi = field['Transmitters'][0]['Azimuth to receiver deg']
+        tilt = field['Transmitters'][0]['Downtilt angle deg']
+
+        if azi <= 180:
+            azi = azi + 180
+        else:
+            azi = azi - 180
+
+        tilt = -tilt
+
+        data_list.append(url)
+        data_list.append(dis)
+        data_list.append(azi)
+        data_list.append(tilt)
+
+        # Adds tower coordinates to dictionary of towers if not already in
+        if tower_name not in towers:
+            lat = field['Transmitters'][0]['Latitude']
+            long = field['Transmitters'][0]['Longitude']
+            height = field['Transmitters'][0]['Antenna height m']
+            towers[tower_name] = [long,lat,height]
+        dict[tower_name] = data_list
+    # Selects the strongest servers from best to weakest signal with a heap
+    # rather than sorting every server returned
+    sorted_dict = heapq.nlargest(servers, dict.items(), key=lambda item:item[1][0])
+    return rlat, rlon, sorted_dict, towers
+
+
+def parse_response(content, network, servers=2):
+    """
+    Decodes and parses one CloudRF response without side effects so it can run
+    in a worker process. Returns (parsed, message, decoded, error) where parsed
+    is the result of parse_best_server, or None with message describing the
+    problem, decoded telling if the response was valid JSON and error holding
+    the error reported by CloudRF, if any.
+    """
+    try:
+        data = json_loads(content)
+    except Exception as error:
+        return None, format_exception(error), False, None
+    try:
+        return parse_best_server(data, network, servers), None, True, None
+    except Exception as error:
+        return None, format_exception(error), True, data.get('error') if isinstance(data, dict) else None
+
+
+def parse_responses(contents, network, servers=2):
+    return [parse_response(content, network, servers) for content in contents]
+
+
+def process_pool(workers):
+    """
+    Returns a pool of worker processes, or None when a single worker is asked
+    for or this module can't be imported by the workers, as is the case for
+    scripts loaded by the QGIS processing toolbox.
+    """
+    if workers <= 1:
+        return None
+    if __name__ != '__main__':
+        try:
+            if importlib.util.find_spec(__name__) is None:
+                return None
+        except (ImportError, ValueError):
+            return None
+    context = multiprocessing.get_context('spawn')
+    # Inside QGIS sys.executable is the QGIS application itself
+    if not os.path.basename(sys.executable).lower().startswith('python'):
+        python = shutil.which('python3') or shutil.which('python')
+        if python is None:
+            return None
+        context.set_executable(python)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+class ResponseParser:
+    """
+    Parses CloudRF responses in chunks over a pool of worker processes, or one
+    at a time in the calling process when no pool is available. submit() and
+    drain() return the (key, result) tuples of the chunks finished so far, in
+    submission order. At most two chunks per worker are kept pending.
+    """
+
+    def __init__(self, network, servers=2, workers=1, chunk_size=256):
+        self.network = network
+        self.servers = servers
+        self.pool = process_pool(workers)
+        self.chunk_size = chunk_size if self.pool is not None else 1
+        self.max_pending = max(2, workers*2)
+        self.chunk = []
+        self.pending = deque()
+
+    def submit(self, key, content):
+        self.chunk.append((key, content))
+        if len(self.chunk) >= self.chunk_size:
+            self.dispatch()
+        return self.ready()
+
+    def dispatch(self):
+        if not self.chunk:
+            return
+        keys = [item[0] for item in self.chunk]
+        contents = [item[1] for item in self.chunk]
+        self.chunk = []
+        if self.pool is None:
+            self.pending.append((keys, contents, None))
+        else:
+            self.pending.append((keys, contents, self.pool.submit(parse_responses, contents, self.network, self.servers)))
+
+    def ready(self, block=False):
+        results = []
+        while self.pending:
+            keys, contents, future = self.pending[0]
+            if future is not None and not (block or future.done() or len(self.pending) > self.max_pending):
+                break
+            self.pending.popleft()
+            try:
+                parsed = future.result() if future is not None else parse_responses(contents, self.network, self.servers)
+            except BrokenProcessPool:
+                # Fall back to parsing in this process if the workers died
+                self.pool = None
+                parsed = parse_responses(contents, self.network, self.servers)
+            results.extend(zip(keys, parsed))
+        return results
+
+    def drain(self):
+        self.dispatch()
+        return self.ready(block=True)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+
+# Connection quality labels indexed by the codes returned by classify_signals
+QUALITY_LABELS = np.array(['Good', 'Marginal', 'Bad', ''])
+
+def classify_signals(signal, t_dbm):
+    """
+    Classifies an array of signal strengths against the threshold in one pass.
+    Returns 0 for Good, 1 for Marginal (within 10 dBm below the threshold),
+    2 for Bad and 3 where there is no signal. t_dbm may also be an array of
+    thresholds broadcast against the signals, such as a column of thresholds
+    against a row of signals to classify them against all of them at once.
+    """
+    threshold = np.asarray(t_dbm, dtype=np.float64)
+    codes = np.full(np.broadcast(signal, threshold).shape, 3, dtype=np.int8)
+    codes[signal < threshold-10] = 2
+    codes[(signal >= threshold-10) & (signal < threshold)] = 1
+    codes[signal >= threshold] = 0
+    return codes
+
+
+class SignalResults:
+    """
+    Columnar store of the parsed results holding the receiver coordinates of
+    every civic and the tower, signal, chart url, distance, azimuth and downtilt
+    of its best servers. Numeric columns are appended to compact arrays and
+    returned as NumPy arrays by column(). Towers are numbered in the order they
+    are first seen and a tower column holds -1 where a civic has no server.
+    Civics answered by the local pre-screen rather than CloudRF are flagged in
+    the estimated column.
+    """
+
+    NUMERIC = ('signal', 'distance', 'azimuth', 'tilt')
+
+    def __init__(self, servers=2):
+        self.servers = servers
+        self.civics = []
+        self.errors = []
+        self.lat = array('d')
+        self.lon = array('d')
+        self.estimated = array('b')
+        self.tower = [array('l') for rank in range(servers)]
+        self.url = [[] for rank in range(servers)]
+        self.numeric = {name: [array('d') for rank in range(servers)] for name in self.NUMERIC}
+        self.tower_names = []
+        self.tower_index = {}
+        self.tower_coordinates = []
+
+    def __len__(self):
+        return len(self.civics)
+
+    def add(self, civics, parsed, estimated=False):
+        rlat, rlon, sorted_dict, towers = parsed
+        for tower_name in towers:
+            if tower_name not in self.tower_index:
+                self.tower_index[tower_name] = len(self.tower_names)
+                self.tower_names.append(tower_name)
+                self.tower_coordinates.append(towers[tower_name])
+        for civic in civics:
+            self.civics.append(civic)
+            self.lat.append(rlat)
+            self.lon.append(rlon)
+            self.estimated.append(1 if estimated else 0)
+            for rank in range(self.servers):
+                if rank < len(sorted_dict):
+                    tower_name, values = sorted_dict[rank]
+                    self.tower[rank].append(self.tower_index[tower_name])
+                    self.url[rank].append(values[1])
+                    for name, value in zip(self.NUMERIC, (values[0],)+tuple(values[2:5])):
+                        self.numeric[name][rank].append(value)
+                else:
+                    self.tower[rank].append(-1)
+                    self.url[rank].append('')
+                    for name in self.NUMERIC:
+                        self.numeric[name][rank].append(float('nan'))
+
+    def add_error(self, civic, error):
+        self.errors.append((civic, error))
+
+    def column(self, name, rank=0):
+        if name == 'tower':
+            return np.array(self.tower[rank], dtype=np.int64)
+        if name == 'estimated':
+            return np.array(self.estimated, dtype=np.int8)
+        if name in ('lat', 'lon'):
+            return np.array(getattr(self, name), dtype=np.float64)
+        return np.array(self.numeric[name][rank], dtype=np.float64)
+
+    def tower_statistics(self, codes):
+        """
+        Counts the Good, Marginal and Bad connections of the civics served best
+        by each tower from their classification codes in one grouped reduction.
+        Returns an array with one row of counts per tower.
+        """
+        tower = self.column('tower')
+        served = tower >= 0
+        counts = np.bincount(tower[served]*3+np.minimum(codes[served], 2), minlength=len(self.tower_names)*3)
+        return counts.reshape(-1, 3)
+
+
+class TowerAggregates:
+    """
+    Coordinates and Good, Marginal and Bad connection counts of every tower
+    kept as fixed-width records of one NumPy structured array, grown by
+    doubling, so the aggregates take 48 bytes per tower however many civics
+    are added. Towers are numbered in the order they are first added.
+    """
+
+    RECORD = np.dtype([('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('good', 'i8'), ('marginal', 'i8'), ('bad', 'i8')])
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.records = np.zeros(64, dtype=self.RECORD)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_counts(cls, names, coordinates, counts):
+        """
+        Returns the aggregates of towers given by name, (x, y, z) coordinates
+        and an array of one row of Good, Marginal and Bad counts per tower.
+        """
+        towers = cls()
+        towers.names = list(names)
+        towers.index = {name: index for index, name in enumerate(towers.names)}
+        towers.records = np.zeros(max(len(towers.names), 1), dtype=cls.RECORD)
+        for index, coordinate in enumerate(coordinates):
+            towers.records[index] = tuple(coordinate)+(0, 0, 0)
+        for column, name in enumerate(('good', 'marginal', 'bad')):
+            towers.records[name][:len(towers.names)] = counts[:len(towers.names), column]
+        return towers
+
+    def add(self, signal_results, codes):
+        """
+        Adds the towers of a SignalResults and the connections of its civics to
+        their best tower, classified by codes.
+        """
+        numbers = []
+        for tower_name, coordinates in zip(signal_results.tower_names, signal_results.tower_coordinates):
+            if tower_name not in self.index:
+                if len(self.names) == len(self.records):
+                    self.records = np.concatenate([self.records, np.zeros(len(self.records), dtype=self.RECORD)])
+                self.index[tower_name] = len(self.names)
+                self.records[len(self.names)] = tuple(coordinates)+(0, 0, 0)
+                self.names.append(tower_name)
+            numbers.append(self.index[tower_name])
+        if numbers:
+            counts = signal_results.tower_statistics(codes)
+            numbers = np.array(numbers, dtype=np.int64)
+            for column, name in enumerate(('good', 'marginal', 'bad')):
+                self.records[name][numbers] += counts[:, column]
+
+    def totals(self):
+        """
+        Returns the Good, Marginal and Bad connections over all towers.
+        """
+        records = self.records[:len(self.names)]
+        return int(records['good'].sum()), int(records['marginal'].sum()), int(records['bad'].sum())
+
+    def coordinates(self, index):
+        record = self.records[index]
+        return float(record['x']), float(record['y']), float(record['z'])
+
+    def attributes(self, index):
+        """
+        Returns the tower layer attributes of a tower, laid out as
+        TOWER_RESULT_FIELDS.
+        """
+        record = self.records[index]
+        x, y, z = self.coordinates(index)
+        good, marginal, bad = int(record['good']), int(record['marginal']), int(record['bad'])
+        total = good+marginal+bad
+        if total == 0:
+            return [self.names[index].replace('_',' '), x, y, z] + [None]*7
+        return [self.names[index].replace('_',' '), x, y, z, good, round(good/total, 4), marginal, round(marginal/total, 4), bad, round(bad/total, 4), total]
+
+
+def chunked(iterable, size):
+    """
+    Yields lists of up to size items of an iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class CheckpointStore:
+    """
+    Single file SQLite checkpoint of a run holding the raw CloudRF response and
+    the parsed result of every request hash, the request hash of every civic,
+    a manifest of the civic fingerprints processed by the last run and the
+    registry of the towers seen in responses. The
+    database runs in WAL mode and one connection is shared by the request
+    workers behind a lock, commits are batched and made on flush().
+
+    Civics are looked up QUERY_CHUNK at a time and the manifest of a run is
+    staged as it goes, so nothing is read for the whole layer at once.
+    """
+
+    COMMIT_EVERY = 200
+    QUERY_CHUNK = 500
+
+    def __init__(self, path, servers=2):
+        self.path = path
+        self.parsed_format = '{}/{}'.format(PARSE_FORMAT, servers)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                request_hash TEXT PRIMARY KEY,
+                network TEXT NOT NULL,
+                body BLOB NOT NULL,
+                parsed TEXT,
+                parsed_format TEXT,
+                received REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS civics (
+                network TEXT NOT NULL,
+                civic TEXT NOT NULL,
+                request_hash TEXT NOT NULL,
+                PRIMARY KEY (network, civic)
+            );
+            CREATE TABLE IF NOT EXISTS manifest (
+                network TEXT NOT NULL,
+                civic TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                PRIMARY KEY (network, civic)
+            );
+            CREATE TABLE IF NOT EXISTS manifest_stage (
+                network TEXT NOT NULL,
+                civic TEXT NOT NULL,
+                fingerprint TEXT,
+                PRIMARY KEY (network, civic)
+            );
+            CREATE TABLE IF NOT EXISTS towers (
+                network TEXT NOT NULL,
+                name TEXT NOT NULL,
+                lon REAL NOT NULL,
+                lat REAL NOT NULL,
+                height REAL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (network, name)
+            );
+        """)
+        self.connection.commit()
+
+    def execute(self, sql, params=(), many=False):
+        with self.lock:
+            if many:
+                self.connection.executemany(sql, params)
+            else:
+                self.connection.execute(sql, params)
+            self.pending += 1
+            if self.pending >= self.COMMIT_EVERY:
+                self.connection.commit()
+                self.pending = 0
+
+    def put_response(self, request_hash, network, content):
+        self.execute('INSERT OR REPLACE INTO responses (request_hash, network, body, received) VALUES (?, ?, ?, ?)',
+                     (request_hash, network, sqlite3.Binary(content), time.time()))
+
+    def put_result(self, request_hash, network, civics, parsed):
+        """
+        Records the parsed result of a response and the civics it answers.
+        """
+        if parsed is not None:
+            self.execute('UPDATE responses SET parsed = ?, parsed_format = ? WHERE request_hash = ?', (json.dumps(parsed), self.parsed_format, request_hash))
+        self.execute('INSERT OR REPLACE INTO civics (network, civic, request_hash) VALUES (?, ?, ?)',
+                     [(network, civic, request_hash) for civic in civics], many=True)
+
+    def forget_civics(self, network, civics):
+        """
+        Drops the responses recorded for civics whose new request failed, so
+        they are missing from the stored results rather than answered by the
+        response of their previous location.
+        """
+        self.execute('DELETE FROM civics WHERE network = ? AND civic = ?', [(network, civic) for civic in civics], many=True)
+
+    def lookup(self, request_hash, max_age=None):
+        """
+        Returns the (body, parsed) of a stored response or None, also None when
+        the response was received more than max_age seconds ago. parsed is None
+        when the response was not parsed or was parsed by another version.
+        """
+        with self.lock:
+            found = self.connection.execute('SELECT body, parsed, parsed_format, received FROM responses WHERE request_hash = ?', (request_hash,)).fetchone()
+        if found is None:
+            return None
+        body, parsed, parsed_format, received = found
+        if max_age is not None and time.time()-received > max_age:
+            return None
+        if parsed is None or parsed_format != self.parsed_format:
+            return bytes(body), None
+        return bytes(body), json.loads(parsed)
+
+    def manifest(self, network, civics=None, max_age=None):
+        """
+        Returns the civic fingerprints recorded by the previous run of a network,
+        for the given civics or for every civic, leaving out civics whose stored
+        response can no longer be found or was received more than max_age
+        seconds ago.
+        """
+        query = """
+            SELECT m.civic, m.fingerprint
+            FROM manifest m
+            JOIN civics c ON c.network = m.network AND c.civic = m.civic
+            JOIN responses r ON r.request_hash = c.request_hash
+            WHERE m.network = ? AND r.received >= ?"""
+        oldest = time.time()-max_age if max_age is not None else 0
+        if civics is None:
+            with self.lock:
+                return dict(self.connection.execute(query, (network, oldest)))
+        found = {}
+        for chunk in chunked(civics, self.QUERY_CHUNK):
+            with self.lock:
+                found.update(self.connection.execute('{} AND m.civic IN ({})'.format(query, ','.join('?'*len(chunk))), [network, oldest]+chunk))
+        return found
+
+    def clear_responses(self, network):
+        """
+        Drops every stored response of a network, local estimates included, so
+        its civics are requested again.
+        """
+        with self.lock:
+            self.connection.execute('DELETE FROM responses WHERE network = ?', (network,))
+            self.connection.commit()
+            self.pending = 0
+
+    def reset_stage(self, network):
+        self.execute('DELETE FROM manifest_stage WHERE network = ?', (network,))
+
+    def stage_manifest(self, network, fingerprints):
+        """
+        Stages the fingerprints of civics processed by this run, None for civics
+        seen but not completed so they are neither kept nor removed.
+        """
+        self.execute('INSERT OR REPLACE INTO manifest_stage (network, civic, fingerprint) VALUES (?, ?, ?)',
+                     [(network, civic, fingerprint) for civic, fingerprint in fingerprints.items()], many=True)
+
+    def commit_manifest(self, network, remove_missing=False):
+        """
+        Replaces the manifest of a network with the completed civics staged by
+        this run. With remove_missing the stored results of civics of the
+        previous manifest that were not seen by this run are dropped. Returns
+        the number of civics dropped.
+        """
+        with self.lock:
+            removed = 0
+            if remove_missing:
+                removed = self.connection.execute("""
+                    DELETE FROM civics WHERE network = ? AND civic IN (
+                        SELECT civic FROM manifest WHERE network = ?
+                        EXCEPT SELECT civic FROM manifest_stage WHERE network = ?)""", (network, network, network)).rowcount
+            self.connection.execute('DELETE FROM manifest WHERE network = ?', (network,))
+            self.connection.execute("""
+                INSERT INTO manifest (network, civic, fingerprint)
+                SELECT network, civic, fingerprint FROM manifest_stage WHERE network = ? AND fingerprint IS NOT NULL""", (network,))
+            self.connection.execute('DELETE FROM manifest_stage WHERE network = ?', (network,))
+            self.connection.commit()
+            self.pending = 0
+        return removed
+
+    def towers(self, network):
+        """
+        Returns the (name, lon, lat, height) of the registered towers of a network.
+        """
+        with self.lock:
+            return self.connection.execute('SELECT name, lon, lat, height FROM towers WHERE network = ? ORDER BY name', (network,)).fetchall()
+
+    def put_towers(self, network, towers):
+        """
+        Registers or updates towers given as a dictionary of name to [lon, lat,
+        height].
+        """
+        now = time.time()
+        self.execute('INSERT OR REPLACE INTO towers (network, name, lon, lat, height, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                     [(network, name, lon, lat, height, now) for name, (lon, lat, height) in towers.items()], many=True)
+
+    def parsed_results(self, network, limit=None):
+        """
+        Yields the parsed results of the CloudRF responses stored for a network,
+        leaving out local estimates, the most recent first.
+        """
+        query = """
+            SELECT parsed FROM responses
+            WHERE network = ? AND parsed_format = ? AND request_hash NOT LIKE '{}%'
+            ORDER BY received DESC""".format(ESTIMATE_PREFIX)
+        if limit:
+            query += ' LIMIT {}'.format(int(limit))
+        with self.lock:
+            found = self.connection.execute(query, (network, self.parsed_format)).fetchall()
+        for parsed, in found:
+            yield json.loads(parsed)
+
+    def manifest_responses(self, network):
+        """
+        Yields batches of (civics, body, parsed) for the stored responses
+        answering the civics completed by the last run of a network, civics
+        being the number of civics sharing the response. parsed is None, and
+        body only read, for responses parsed by another version.
+        """
+        with self.lock:
+            cursor = self.connection.execute("""
+                SELECT COUNT(*), CASE WHEN r.parsed_format = ? THEN NULL ELSE r.body END, CASE WHEN r.parsed_format = ? THEN r.parsed END
+                FROM manifest m
+                JOIN civics c ON c.network = m.network AND c.civic = m.civic
+                JOIN responses r ON r.request_hash = c.request_hash
+                WHERE m.network = ? GROUP BY r.request_hash""", (self.parsed_format, self.parsed_format, network))
+        while True:
+            with self.lock:
+                found = cursor.fetchmany(self.QUERY_CHUNK)
+            if not found:
+                return
+            yield [(civics, bytes(body) if body is not None else None, json.loads(parsed) if parsed is not None else None) for civics, body, parsed in found]
+
+    def civic_results(self, network, civics):
+        """
+        Yields (request_hash, civics, body, parsed) for the stored responses
+        answering the given civics, grouping civics that share a response. parsed is None
+        when the response was parsed by another version.
+        """
+        for chunk in chunked(civics, self.QUERY_CHUNK):
+            with self.lock:
+                found = self.connection.execute("""
+                    SELECT c.civic, c.request_hash, r.body, r.parsed, r.parsed_format
+                    FROM civics c JOIN responses r ON r.request_hash = c.request_hash
+                    WHERE c.network = ? AND c.civic IN ({}) ORDER BY c.request_hash""".format(','.join('?'*len(chunk))), [network]+chunk).fetchall()
+            for row_hash, group in itertools.groupby(found, key=lambda item: item[1]):
+                group = list(group)
+                body, parsed, parsed_format = group[0][2:]
+                yield row_hash, [item[0] for item in group], bytes(body), json.loads(parsed) if parsed is not None and parsed_format == self.parsed_format else None
+
+    def flush(self):
+        with self.lock:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+# Request fields that change the CloudRF answer. The civic ID, user ID and API
+# key are left out so identical locations share one cached response
+REQUEST_KEY_FIELDS = ('net', 'lat', 'lon', 'rxh', 'rxg', 'ant', 'res')
+
+def request_hash(row):
+    """
+    Returns a SHA-256 hash of the normalized request parameters of a civic row.
+    Coordinates are rounded to 6 decimals (about 0.1 m) before hashing.
+    """
+    normalized = {}
+    for field in REQUEST_KEY_FIELDS:
+        value = row.get(field)
+        if value is None or value == '':
+            continue
+        if field in ('lat', 'lon'):
+            value = '{:.6f}'.format(float(value))
+        normalized[field] = str(value).strip()
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def is_valid_response(content):
+    """
+    Returns True if content is a CloudRF best server response listing servers
+    rather than an error message.
+    """
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return False
+    return isinstance(data, list) and len(data) > 0
+
+
+def snap_to_grid(lat, lon, cell_m):
+    """
+    Snaps a WGS84 coordinate to a grid of roughly cell_m metre square cells and
+    returns the (row, column) index of the cell and the coordinates of its centre.
+    Columns are widened with the latitude of the cell row so cells stay square.
+    """
+    lat_step = cell_m/111320.0
+    grid_row = math.floor(lat/lat_step)
+    centre_lat = (grid_row+0.5)*lat_step
+    lon_step = cell_m/(111320.0*max(math.cos(math.radians(centre_lat)), 1e-6))
+    grid_col = math.floor(lon/lon_step)
+    return (grid_row, grid_col), (centre_lat, (grid_col+0.5)*lon_step)
+
+
+def group_civics(rows, cell_m=None):
+    """
+    Yields (row, civics) tuples with one request row per group of civics. When
+    cell_m is given civics falling in the same grid cell are grouped and the
+    request is made once for the centre of the cell, otherwise every civic is
+    requested on its own.
+    """
+    if not cell_m:
+        for row in rows:
+            yield row, [row['civic']]
+        return
+    cells = {}
+    for row in rows:
+        cell, centre = snap_to_grid(float(row['lat']), float(row['lon']), cell_m)
+        if cell in cells:
+            cells[cell][1].append(row['civic'])
+        else:
+            cells[cell] = (dict(row, lat='{:.6f}'.format(centre[0]), lon='{:.6f}'.format(centre[1])), [row['civic']])
+    for group in cells.values():
+        yield group
+
+
+class SizeCappedStore:
+    """
+    Index of the entries of a cache kept in a single SQLite file, with the size,
+    the time stored and the time last used of each entry under a namespace and
+    key, and optionally the entry content as a blob. The total size is read
+    from the index so opening a cache never lists or stats its files. Entries
+    older than the TTL are treated as missing and the least recently used
+    entries are evicted once the total grows past the size limit, calling
+    on_evict(namespace, key) for each so caches keeping their content in files
+    can delete them. Entries used since keep_since are never evicted.
+
+    Every write is committed on its own so the jobs of a batch can share a
+    store without holding its write lock between requests.
+    """
+
+    def __init__(self, path, ttl_days=0, max_mb=1024, on_evict=None, keep_since=None):
+        self.path = path
+        self.ttl = ttl_days*86400 if ttl_days and ttl_days > 0 else None
+        self.max_bytes = int(max_mb*1024*1024)
+        self.on_evict = on_evict
+        self.keep_since = keep_since
+        self.lock = threading.Lock()
+        self.created = not os.path.exists(path)
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored REAL NOT NULL,
+                used REAL NOT NULL,
+                content BLOB,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+        """)
+        self.size = self.total()
+
+    def total(self):
+        with self.lock:
+            return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get(self, namespace, key):
+        """
+        Returns the content of an entry, b'' for an entry stored without
+        content, or None when it is missing or expired. The entry is marked
+        as used.
+        """
+        now = time.time()
+        with self.lock:
+            found = self.connection.execute('SELECT content, stored, size FROM entries WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+            if found is None:
+                return None
+            content, stored, size = found
+            if self.ttl is not None and now-stored > self.ttl:
+                self.connection.execute('DELETE FROM entries WHERE namespace = ? AND key = ?', (namespace, key))
+                self.size -= size
+                expired = True
+            else:
+                self.connection.execute('UPDATE entries SET used = ? WHERE namespace = ? AND key = ?', (now, namespace, key))
+                expired = False
+        if expired:
+            if self.on_evict is not None:
+                self.on_evict(namespace, key)
+            return None
+        return bytes(content) if content is not None else b''
+
+    def put(self, namespace, key, size, content=None, stored=None):
+        """
+        Adds or replaces an entry of the given size, evicting least recently
+        used entries when the store grows past its size limit.
+        """
+        now = time.time()
+        with self.lock:
+            previous = self.connection.execute('SELECT size FROM entries WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+            self.connection.execute('INSERT OR REPLACE INTO entries (namespace, key, size, stored, used, content) VALUES (?, ?, ?, ?, ?, ?)',
+                                    (namespace, key, size, stored or now, now, sqlite3.Binary(content) if content is not None else None))
+            self.size += size-(previous[0] if previous else 0)
+            over_limit = self.size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the store is back under 90%
+        of its size limit, leaving entries used since keep_since.
+        """
+        used_before = self.keep_since
+        self.size = self.total()
+        target = self.max_bytes*0.9
+        query = 'SELECT namespace, key, size FROM entries{} ORDER BY used LIMIT 500'.format(' WHERE used < ?' if used_before is not None else '')
+        while self.size > target:
+            with self.lock:
+                found = self.connection.execute(query, (used_before,) if used_before is not None else ()).fetchall()
+            if not found:
+                return
+            for namespace, key, size in found:
+                if self.size <= target:
+                    return
+                self.remove(namespace, key, size)
+
+    def remove(self, namespace, key, size):
+        with self.lock:
+            self.connection.execute('DELETE FROM entries WHERE namespace = ? AND key = ?', (namespace, key))
+            self.size -= size
+        if self.on_evict is not None:
+            self.on_evict(namespace, key)
+
+    def invalidate(self, namespace):
+        """
+        Drops every entry of a namespace.
+        """
+        with self.lock:
+            keys = [key for key, in self.connection.execute('SELECT key FROM entries WHERE namespace = ?', (namespace,))]
+            self.connection.execute('DELETE FROM entries WHERE namespace = ?', (namespace,))
+        self.size = self.total()
+        if self.on_evict is not None:
+            for key in keys:
+                self.on_evict(namespace, key)
+
+    def close(self):
+        self.connection.close()
+
+
+class ResponseCache:
+    """
+    Content addressed cache of CloudRF responses kept compressed in a single
+    SQLite SizeCappedStore in the cache folder, one entry per network and
+    request hash. Entries older than the TTL are ignored and the least recently
+    used entries are evicted once the cache grows past its size limit.
+    Responses cached as one JSON file per request by earlier versions are
+    moved into the store the first time it is opened.
+    """
+
+    def __init__(self, folder, ttl_days=30, max_mb=1024):
+        self.folder = folder
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.store = SizeCappedStore(os.path.join(folder, 'responses.sqlite'), ttl_days, max_mb)
+        if self.store.created:
+            self.migrate()
+
+    def migrate(self):
+        for root, dirs, files in os.walk(self.folder, topdown=False):
+            for name in files:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    network = os.path.basename(os.path.dirname(root))
+                    try:
+                        with open(path, 'rb') as cached:
+                            content = cached.read()
+                        stored = os.stat(path).st_mtime
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    compressed = zlib.compress(content)
+                    self.store.put(network, name[:-5], len(compressed), compressed, stored)
+            if root != self.folder and not os.listdir(root):
+                os.rmdir(root)
+
+    def namespace(self, network):
+        return re.sub(r'[^\w\-.]', '_', network)
+
+    def get(self, network, key):
+        content = self.store.get(self.namespace(network), key)
+        if not content:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return zlib.decompress(content)
+
+    def put(self, network, key, content):
+        if not is_valid_response(content):
+            return False
+        compressed = zlib.compress(content)
+        self.store.put(self.namespace(network), key, len(compressed), compressed)
+        return True
+
+    def invalidate(self, network):
+        """
+        Drops every cached response of a network.
+        """
+        self.store.invalidate(self.namespace(network))
+
+    def close(self):
+        self.store.close()
+
+
+class ChartCache:
+    """
+    Local cache of the CloudRF path profile chart images, one file per chart
+    url so a chart shared by several civics or runs is only downloaded once.
+    Missing charts are downloaded concurrently over one pooled session. The
+    charts are indexed in a SizeCappedStore and the least recently used
+    charts are evicted once the cache grows past its size limit, apart from
+    the charts downloaded or localized since the cache was opened, which the
+    outputs being written point at. localize() points the chart urls of a set
+    of results at the local copies, charts that could not be downloaded keep
+    their remote url.
+    """
+
+    NAMESPACE = 'charts'
+
+    def __init__(self, folder, max_mb=512, concurrency=8, rate_limit=0, timeout=60.0, strict_ssl=True):
+        self.folder = folder
+        self.concurrency = max(1, int(concurrency))
+        self.limiter = TokenBucketRateLimiter(rate_limit)
+        self.timeout = (10.0, timeout)
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency, max_retries=2, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.verify = strict_ssl
+        self.downloaded = 0
+        self.failed = 0
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.store = SizeCappedStore(os.path.join(folder, 'charts.sqlite'), 0, max_mb, self.remove, time.time())
+        if self.store.created:
+            self.migrate()
+
+    def migrate(self):
+        # Charts downloaded before the index existed
+        for root, dirs, files in os.walk(self.folder):
+            for name in files:
+                if not name.endswith(('.tmp', '.sqlite', '.sqlite-wal', '.sqlite-shm')):
+                    path = os.path.join(root, name)
+                    try:
+                        size = os.path.getsize(path)
+                    except OSError:
+                        continue
+                    self.store.put(self.NAMESPACE, os.path.relpath(path, self.folder), size, stored=os.stat(path).st_mtime)
+
+    def key(self, url):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        extension = os.path.splitext(url.split('?')[0])[1].lower()
+        return os.path.join(digest[:2], digest+(extension if extension in ('.png', '.jpg', '.jpeg', '.gif', '.svg') else '.png'))
+
+    def path(self, url):
+        return os.path.join(self.folder, self.key(url))
+
+    def remove(self, namespace, key):
+        try:
+            os.remove(os.path.join(self.folder, key))
+        except OSError:
+            pass
+
+    def download(self, url):
+        path = self.path(url)
+        if not self.limiter.acquire():
+            return False
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            with self.lock:
+                self.failed += 1
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(temp_path, 'wb') as chart:
+            chart.write(response.content)
+        os.replace(temp_path, path)
+        with self.lock:
+            self.downloaded += 1
+        self.store.put(self.NAMESPACE, self.key(url), len(response.content))
+        return True
+
+    def prefetch(self, urls, feedback=None):
+        """
+        Downloads the charts of urls missing from the cache, stopping early
+        when feedback is canceled. Returns the number of charts downloaded.
+        """
+        missing = sorted(set(url for url in urls if url and not os.path.exists(self.path(url))))
+        if not missing:
+            return 0
+        if feedback is not None:
+            feedback.pushInfo('Downloading {} chart images with {} concurrent requests...'.format(len(missing), self.concurrency))
+        downloaded = self.downloaded
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for chunk in chunked(missing, self.concurrency*4):
+                if feedback is not None and feedback.isCanceled():
+                    break
+                list(executor.map(self.download, chunk))
+        return self.downloaded-downloaded
+
+    def localize(self, signal_results, feedback=None):
+        """
+        Downloads the missing charts of a SignalResults and replaces its chart
+        urls with file urls of the local copies.
+        """
+        self.prefetch((url for urls in signal_results.url for url in urls), feedback)
+        local = {}
+        for urls in signal_results.url:
+            for position, url in enumerate(urls):
+                if not url:
+                    continue
+                if url not in local:
+                    path = self.path(url)
+                    # Marks the chart used so it is kept while this run's
+                    # outputs are written and evicted last afterwards
+                    if self.store.get(self.NAMESPACE, self.key(url)) is not None and os.path.exists(path):
+                        local[url] = Path(os.path.abspath(path)).as_uri()
+                    else:
+                        local[url] = url
+                urls[position] = local[url]
+
+    def close(self):
+        self.session.close()
+        self.store.close()
+
+
+class TowerRegistry:
+    """
+    Towers of a network kept in the checkpoint store across runs, updated from
+    the towers of every response, with a spatial index answering k-nearest and
+    radius queries for whole arrays of civics at once. Towers are indexed as
+    unit vectors so straight line distances order the same as great circle
+    distances anywhere on the globe. The index is a SciPy KD-tree when SciPy is
+    installed, otherwise towers are searched in blocks of civics with one
+    matrix product per block. The index is rebuilt on the first query after
+    towers change.
+    """
+
+    EARTH_RADIUS_KM = 6371.0088
+    BLOCK = 2048
+
+    def __init__(self, towers=()):
+        self.names = []
+        self.index = {}
+        self.coordinates = []
+        self.changed = {}
+        self.vectors = None
+        self.tree = None
+        for name, lon, lat, height in towers:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            self.coordinates.append((lon, lat, height))
+
+    @classmethod
+    def load(cls, checkpoint, network):
+        return cls(checkpoint.towers(network))
+
+    def __len__(self):
+        return len(self.names)
+
+    def update(self, towers):
+        """
+        Adds or moves the towers of a parsed response, given as a dictionary of
+        name to [lon, lat, height].
+        """
+        for name, coordinates in towers.items():
+            coordinates = tuple(coordinates)
+            number = self.index.get(name)
+            if number is None:
+                self.index[name] = len(self.names)
+                self.names.append(name)
+                self.coordinates.append(coordinates)
+            elif self.coordinates[number] == coordinates:
+                continue
+            else:
+                self.coordinates[number] = coordinates
+            self.changed[name] = coordinates
+            self.vectors = None
+
+    def save(self, checkpoint, network):
+        """
+        Writes the towers added or moved since the last save to the checkpoint
+        store and returns their number.
+        """
+        changed = len(self.changed)
+        if changed:
+            checkpoint.put_towers(network, self.changed)
+            self.changed = {}
+        return changed
+
+    def columns(self):
+        """
+        Returns the longitude, latitude and height of every tower as arrays.
+        """
+        return np.array(self.coordinates, dtype=np.float64).reshape(-1, 3).T
+
+    @staticmethod
+    def unit_vectors(lon, lat):
+        lon = np.radians(np.asarray(lon, dtype=np.float64))
+        lat = np.radians(np.asarray(lat, dtype=np.float64))
+        return np.column_stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)])
+
+    def build(self):
+        if self.vectors is None:
+            lon, lat, height = self.columns()
+            self.vectors = self.unit_vectors(lon, lat)
+            self.tree = cKDTree(self.vectors) if cKDTree is not None and len(self.names) else None
+
+    def chord_km(self, chord):
+        return 2*self.EARTH_RADIUS_KM*np.arcsin(np.minimum(1, np.asarray(chord)/2))
+
+    def nearest(self, lon, lat, k=1):
+        """
+        Returns the great circle distances in km and tower numbers of the k
+        nearest towers of every point, as arrays of one row per point sorted
+        from the nearest tower.
+        """
+        self.build()
+        points = self.unit_vectors(np.atleast_1d(lon), np.atleast_1d(lat))
+        k = min(k, len(self.names))
+        if k == 0:
+            return np.zeros((len(points), 0)), np.zeros((len(points), 0), dtype=np.int64)
+        if self.tree is not None:
+            chord, numbers = self.tree.query(points, k)
+            return self.chord_km(chord).reshape(len(points), k), np.asarray(numbers, dtype=np.int64).reshape(len(points), k)
+        distances = []
+        numbers = []
+        for start in range(0, len(points), self.BLOCK):
+            # The nearest towers have the largest dot products with a point
+            dot = points[start:start+self.BLOCK] @ self.vectors.T
+            block = np.argpartition(-dot, k-1, axis=1)[:, :k] if k < len(self.names) else np.tile(np.arange(k), (len(dot), 1))
+            block_dot = np.take_along_axis(dot, block, axis=1)
+            order = np.argsort(-block_dot, axis=1)
+            numbers.append(np.take_along_axis(block, order, axis=1))
+            distances.append(self.chord_km(np.sqrt(np.maximum(0, 2-2*np.take_along_axis(block_dot, order, axis=1)))))
+        return np.concatenate(distances), np.concatenate(numbers)
+
+    def within(self, lon, lat, radius_km):
+        """
+        Returns an array of the numbers of the towers within radius_km of every
+        point.
+        """
+        self.build()
+        points = self.unit_vectors(np.atleast_1d(lon), np.atleast_1d(lat))
+        chord = 2*math.sin(min(radius_km/self.EARTH_RADIUS_KM, math.pi)/2)
+        if self.tree is not None:
+            return [np.array(sorted(found), dtype=np.int64) for found in self.tree.query_ball_point(points, chord)]
+        found = []
+        for start in range(0, len(points), self.BLOCK):
+            dot = points[start:start+self.BLOCK] @ self.vectors.T if len(self.names) else np.zeros((len(points[start:start+self.BLOCK]), 0))
+            found.extend(np.flatnonzero(row) for row in dot >= 1-chord**2/2)
+        return found
+
+
+# Request hashes of local estimates are prefixed so they are never mistaken
+# for CloudRF responses
+ESTIMATE_PREFIX = 'estimate:'
+
+# Rows looked up in the checkpoint store and response cache before the misses
+# are pre-screened with one nearest tower query
+SCREEN_BATCH = 256
+
+class PathLossScreen:
+    """
+    Local pre-screen estimating the best signal of a civic from the tower
+    registry and the signals of the CloudRF responses stored by previous runs
+    of a network. Only the NEAREST towers of a civic are estimated.
+
+    The signal at d km from a tower is modelled as an intercept per tower less
+    slope dB for every tenfold distance. The free space model keeps the slope at
+    20 dB, the empirical model fits it on the stored signals. Intercepts are
+    fitted on the stored signals of each tower, towers with few signals use
+    the median intercept of the network. Civics whose estimated best signal is
+    at least margin dB above the threshold, or margin dB below the marginal
+    band, are answered locally. Civics in the ambiguous band in between are
+    left to CloudRF.
+    """
+
+    MODELS = ('empirical', 'free_space')
+    MIN_SAMPLES = 20
+    MIN_TOWER_SAMPLES = 5
+    NEAREST = 16
+
+    def __init__(self, registry, samples, t_dbm, model='empirical', margin=10.0):
+        self.model = model
+        self.margin = float(margin)
+        self.t_dbm = float(t_dbm)
+        self.key = '{}/{}/{}'.format(model, self.margin, self.t_dbm)
+        # The towers are those of the registry when fitted, later additions to
+        # the registry have no fitted intercept
+        self.names = list(registry.names)
+        self.lon, self.lat, self.height = registry.columns()
+        self.registry = TowerRegistry(zip(self.names, self.lon.tolist(), self.lat.tolist(), self.height.tolist()))
+        tower = np.array([registry.index[name] for name, distance, signal in samples], dtype=np.int64)
+        x = np.log10(np.maximum([distance for name, distance, signal in samples], 0.01))
+        y = np.array([signal for name, distance, signal in samples], dtype=np.float64)
+        counts = np.bincount(tower, minlength=len(self.names))
+        self.slope = -20.0
+        if model == 'empirical':
+            # Slope shared by every tower, fitted on the distances and signals
+            # centred on the mean of their tower
+            dx = x-(np.bincount(tower, x, len(self.names))/np.maximum(counts, 1))[tower]
+            dy = y-(np.bincount(tower, y, len(self.names))/np.maximum(counts, 1))[tower]
+            if np.dot(dx, dx) > 0:
+                self.slope = float(np.dot(dx, dy)/np.dot(dx, dx))
+        offsets = y-self.slope*x
+        self.intercept = np.full(len(self.names), float(np.median(offsets)))
+        fitted = counts >= self.MIN_TOWER_SAMPLES
+        self.intercept[fitted] = (np.bincount(tower, offsets, len(self.names))/np.maximum(counts, 1))[fitted]
+        self.samples = len(samples)
+        self.spread = float(np.std(y-self.intercept[tower]-self.slope*x))
+        self.good = 0
+        self.bad = 0
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, network, registry, t_dbm, model='empirical', margin=10.0, limit=50000):
+        """
+        Fits the pre-screen on the responses stored in a checkpoint store, or
+        returns None when fewer than MIN_SAMPLES signals are stored. Towers of
+        the stored responses missing from the registry are added to it.
+        """
+        samples = []
+        for rlat, rlon, sorted_dict, found in checkpoint.parsed_results(network, limit):
+            registry.update(found)
+            for tower_name, values in sorted_dict:
+                if tower_name in found:
+                    samples.append((tower_name, float(values[2]), float(values[0])))
+        if len(samples) < cls.MIN_SAMPLES:
+            return None
+        return cls(registry, samples, t_dbm, model, margin)
+
+    def estimate(self, rows, servers=5):
+        """
+        Returns a best server response estimated for every request row, laid
+        out as CloudRF's with an empty chart image, or None for rows whose best
+        signal falls in the ambiguous band. The nearest towers of all of the
+        rows are found with one query.
+        """
+        if not rows:
+            return []
+        lat = np.array([float(row['lat']) for row in rows], dtype=np.float64)
+        lon = np.array([float(row['lon']) for row in rows], dtype=np.float64)
+        distance, nearest = self.registry.nearest(lon, lat, self.NEAREST)
+        signal = self.intercept[nearest]+self.slope*np.log10(np.maximum(distance, 0.01))
+        best = signal.max(axis=1)
+        good = best >= self.t_dbm+self.margin
+        bad = best < self.t_dbm-10-self.margin
+        self.good += int(good.sum())
+        self.bad += int(bad.sum())
+
+        # Azimuth and downtilt from the tower to the receiver, as CloudRF
+        # reports them
+        phi1, phi2 = np.radians(lat)[:, None], np.radians(self.lat[nearest])
+        dlon = np.radians(lon[:, None]-self.lon[nearest])
+        azimuth = np.degrees(np.arctan2(np.sin(dlon)*np.cos(phi1), np.cos(phi2)*np.sin(phi1)-np.sin(phi2)*np.cos(phi1)*np.cos(dlon))) % 360
+        contents = []
+        for number, row in enumerate(rows):
+            if not (good[number] or bad[number]):
+                contents.append(None)
+                continue
+            rxh = float(row.get('rxh') or 0)
+            response = []
+            for position in np.argsort(-signal[number])[:servers].tolist():
+                index = nearest[number, position]
+                response.append({
+                    'Server name': '{}_{}_{}'.format(row['uid'], row['net'], self.names[index].replace(' ', '_')),
+                    'Chart image': '',
+                    'Receiver': [{'Latitude': float(lat[number]), 'Longitude': float(lon[number]), 'Antenna height m': rxh}],
+                    'Transmitters': [{
+                        'Latitude': float(self.lat[index]),
+                        'Longitude': float(self.lon[index]),
+                        'Antenna height m': float(self.height[index]),
+                        'Signal power at receiver dBm': round(float(signal[number, position]), 1),
+                        'Distance to receiver km': round(float(distance[number, position]), 3),
+                        'Azimuth to receiver deg': round(float(azimuth[number, position]), 1),
+                        'Downtilt angle deg': round(math.degrees(math.atan2(float(self.height[index])-rxh, max(float(distance[number, position]), 0.001)*1000)), 2)
+                    }]
+                })
+            contents.append(json.dumps(response).encode('utf-8'))
+        return contents
+
+
+def network_prefix(network):
+    """
+    Returns the prefix of the signal strength field names of a network, the
+    first part of the network name truncated to four characters.
+    """
+    if len(network.split('_')[0])>5:
+        return network.split('_')[0][0:4]
+    return network.split('_')[0]
+
+
+def civic_result_fields(prefix, servers=2):
+    """
+    Returns the (name, type) of the signal strength fields added to the fields
+    of the input civics, seven fields for each of the N best servers of a civic
+    and a flag set on civics estimated by the pre-screen. The lowercase
+    distance field name of the best server is kept for existing styles.
+    """
+    fields = [('civic_lat', float), ('civic_lon', float), ('target', float)]
+    for rank in range(1, servers+1):
+        fields.extend([('{}_T{}'.format(prefix, rank), str),
+                       ('{}_S{}'.format(prefix, rank), float),
+                       ('{}S{}_QoC'.format(prefix, rank), str),
+                       ('{}S{}_url'.format(prefix, rank), str),
+                       ('{}{}{}_dis'.format(prefix, 's' if rank == 1 else 'S', rank), float),
+                       ('{}S{}_azi'.format(prefix, rank), float),
+                       ('{}S{}_tlt'.format(prefix, rank), float)])
+    fields.append(('{}_est'.format(prefix), int))
+    return fields
+
+
+TOWER_RESULT_FIELDS = [('Tower', str), ('X', float), ('Y', float), ('Z', float),
+                       ('Good_Con', int), ('Good_Pct', float), ('Margin_Con', int), ('Margin_Pct', float),
+                       ('Bad_Con', int), ('Bad_Pct', float), ('Total_Con', int)]
+
+SPOKE_RESULT_FIELDS = [('rank', int), ('signal', float), ('url', str)]
+
+SERVER_TABLE_FIELDS = [('rank', int), ('tower', str), ('signal', float), ('quality', str), ('url', str),
+                       ('distance', float), ('azimuth', float), ('tilt', float), ('estimated', int)]
+
+
+class WGS84Transform:
+    """
+    Transforms coordinates from a CRS, given as a QgsCoordinateReferenceSystem
+    or as an authority code or WKT string, to WGS84 longitude and latitude.
+    Whole coordinate arrays are transformed in one call, with pyproj when it is
+    installed and otherwise with a QgsCoordinateTransform of a single multipoint
+    geometry holding all of the points. QGIS is also used when the transform
+    context holds a datum transformation chosen for the CRS. identity is True
+    when the CRS already is WGS84 and no transform is needed. The time spent
+    transforming is added to the reproject phase of metrics when given.
+    """
+
+    def __init__(self, crs, transform_context=None, metrics=None):
+        self.metrics = metrics
+        if isinstance(crs, str):
+            definition = crs
+            self.identity = crs.upper() in ('EPSG:4326', 'OGC:CRS84')
+        else:
+            definition = crs.authid() or crs.toWkt()
+            self.identity = crs.authid() == 'EPSG:4326'
+        self.transformer = None
+        self.qgs_transform = None
+        if self.identity:
+            return
+        chosen = False
+        if not isinstance(crs, str):
+            wgs84 = QgsCoordinateReferenceSystem('EPSG:4326')
+            self.qgs_transform = QgsCoordinateTransform(crs, wgs84, transform_context or QgsProject.instance())
+            chosen = transform_context is not None and transform_context.hasTransform(crs, wgs84)
+        if pyproj is not None and not chosen:
+            self.transformer = pyproj.Transformer.from_crs(definition, 'EPSG:4326', always_xy=True)
+        elif self.qgs_transform is None:
+            raise ValueError('Coordinates in {} can only be reprojected with pyproj installed'.format(definition))
+
+    def points(self, x, y):
+        """
+        Returns the longitudes and latitudes of arrays of x and y coordinates.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if self.identity or len(x) == 0:
+            return x, y
+        with self.metrics.phase('reproject') if self.metrics is not None else contextlib.nullcontext():
+            return self.transform(x, y)
+
+    def transform(self, x, y):
+        if self.transformer is not None:
+            return self.transformer.transform(x, y)
+        geometry = QgsGeometry.fromMultiPointXY([QgsPointXY(px, py) for px, py in zip(x.tolist(), y.tolist())])
+        geometry.transform(self.qgs_transform)
+        points = geometry.asMultiPoint()
+        return np.array([point.x() for point in points]), np.array([point.y() for point in points])
+
+    def geometry(self, geometry):
+        """
+        Returns a copy of a QGIS geometry transformed to WGS84.
+        """
+        geometry = QgsGeometry(geometry)
+        if not self.identity:
+            with self.metrics.phase('reproject') if self.metrics is not None else contextlib.nullcontext():
+                geometry.transform(self.qgs_transform)
+        return geometry
+
+
+def transform_points(points, transform, chunk_size=4096):
+    """
+    Reprojects (civic, x, y, attributes) tuples to WGS84 a chunk at a time,
+    yielding (civic, lon, lat, attributes) tuples in the same order.
+    """
+    for chunk in chunked(points, chunk_size):
+        lon, lat = transform.points([point[1] for point in chunk], [point[2] for point in chunk])
+        for (civic, x, y, attributes), point_lon, point_lat in zip(chunk, lon.tolist(), lat.tolist()):
+            yield civic, point_lon, point_lat, attributes
+
+
+def feature_points(features, civic_field, transform=None):
+    """
+    Yields the civic ID, longitude, latitude and attributes of every civic
+    feature, using the first point of multipart features. Coordinates are
+    reprojected in bulk with the WGS84Transform given, otherwise the features
+    must be in WGS84.
+    """
+    def source_points():
+        for feat in features:
+            if feat.geometry().isMultipart():
+                point = feat.geometry().asMultiPoint()[0]
+            else:
+                point = feat.geometry().asPoint()
+            yield civic_key(feat[civic_field]), point.x(), point.y(), feat.attributes()
+    if transform is None or transform.identity:
+        return source_points()
+    return transform_points(source_points(), transform)
+
+
+def iter_point_rows(points, uid, key, rxh, rxg, network, fingerprints=None):
+    """
+    Yields the CloudRF request parameters of every (civic, lon, lat, attributes)
+    point. When a fingerprints dictionary is given a hash of the coordinates and
+    attributes of every point is stored in it by civic ID.
+    """
+    for civic_ID, lon, lat, attributes in points:
+        if fingerprints is not None:
+            fingerprints[civic_ID] = hashlib.sha1(repr((lon, lat, list(attributes))).encode('utf-8')).hexdigest()
+        yield {'civic': civic_ID, 'uid': uid, 'key': key, 'rxh': rxh, 'rxg': rxg, 'net': network,
+               'lat': '{}'.format(lat), 'lon': '{}'.format(lon)}
+
+
+class ConsoleFeedback:
+    """
+    Stand-in for the QGIS processing feedback when the pipeline runs outside of
+    QGIS. Messages are written to stderr and progress is reported in whole
+    percents.
+    """
+
+    def __init__(self, total_steps=0, stream=None):
+        self.total_steps = total_steps
+        self.stream = stream or sys.stderr
+        self.canceled = False
+        self.percent = -1
+
+    def pushInfo(self, message):
+        print(message, file=self.stream, flush=True)
+
+    def isCanceled(self):
+        return self.canceled
+
+    def cancel(self):
+        self.canceled = True
+
+    def setCurrentStep(self, step):
+        if self.total_steps:
+            self.setProgress(100.0*step/self.total_steps)
+
+    def setProgress(self, progress):
+        if int(progress) != self.percent:
+            self.percent = int(progress)
+            print('{}%'.format(self.percent), file=self.stream, flush=True)
+
+
+def format_duration(seconds):
+    """
+    Formats a number of seconds as h:mm:ss.
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+class ProgressReporter:
+    """
+    Batches the progress of every civic into one message every interval
+    seconds. The message gives the civics finished so far, grouped by where
+    their answer came from. It also gives the throughput over the last window
+    seconds and the time remaining at that rate. progress(n) is only called
+    when the finished share moves by a whole percent, so large layers don't
+    flood the QGIS message log and progress bar.
+    """
+
+    def __init__(self, feedback, total, progress=None, interval=2.0, window=30.0):
+        self.feedback = feedback
+        self.total = total
+        self.progress = progress
+        self.interval = interval
+        self.window = window
+        self.done = 0
+        self.counts = {}
+        self.percent = -1
+        self.last_report = time.monotonic()
+        self.samples = deque([(self.last_report, 0)])
+
+    def update(self, civics, source):
+        self.done += civics
+        self.counts[source] = self.counts.get(source, 0)+civics
+        if self.progress is not None and self.total:
+            percent = self.done*100//self.total
+            if percent != self.percent:
+                self.percent = percent
+                self.progress(self.done)
+        now = time.monotonic()
+        if now-self.last_report >= self.interval:
+            self.report(now)
+
+    def rate(self, now):
+        """
+        Returns the civics finished per second over the last window seconds.
+        """
+        self.samples.append((now, self.done))
+        while len(self.samples) > 2 and self.samples[1][0] < now-self.window:
+            self.samples.popleft()
+        start, done = self.samples[0]
+        return (self.done-done)/(now-start) if now > start else 0.0
+
+    def report(self, now=None):
+        now = now or time.monotonic()
+        self.last_report = now
+        rate = self.rate(now)
+        sources = ', '.join('{} {}'.format(count, source) for source, count in self.counts.items())
+        if self.total and rate > 0:
+            eta = ', about {} remaining'.format(format_duration(max(0, self.total-self.done)/rate))
+        else:
+            eta = ''
+        self.feedback.pushInfo('Best signal for {}/{} civics ({}), {:.1f} civics/s{}'.format(self.done, self.total or '?', sources, rate, eta))
+        if self.progress is not None and not self.total:
+            self.progress(self.done)
+
+
+def checkpoint_path(data_folder, network):
+    return "{}{}{}_best_signal.sqlite".format(data_folder,os.sep,network)
+
+
+def best_signal_analysis(civic_rows, fingerprints, network, res, data_folder, server='https://cloudrf.com', strict_ssl=True, top_n=2,
+                         concurrency=4, rate_limit=4.0, max_retries=5, retry_budget=500, timeout=120.0, gzip=True, cache_folder=None,
+                         cache_ttl=30, cache_size=1024, clear_cache=False, snap_m=None, incremental=False, parse_workers=1,
+                         feedback=None, total=0, progress=None, limiter=None, slots=None, metrics=None, chunk_size=None, on_chunk=None,
+                         t_dbm='-65', prescreen=None, prescreen_margin=10.0, request_phase='request'):
+    """
+    Requests, parses and collects the best servers of every civic row, as made
+    by iter_point_rows, and returns them in a SignalResults, or None when the
+    run is canceled. This is the whole CloudRF side of the analysis, shared by
+    the QGIS algorithm, the command line and the batch runner, which passes a
+    shared rate limiter and semaphore of request slots.
+
+    Raw responses and parsed results are checkpointed in a SQLite file in the
+    data folder and valid responses are kept in the response cache, which
+    defaults to a cloudrf_cache folder next to the data folder. When given,
+    progress(n) is called with the number of civics finished so far and the
+    request, parse and cache statistics are added to metrics. The request
+    phase, named request_phase, covers the whole streaming stage, parse the
+    part of it spent parsing. Cache misses only count the requests that were
+    not answered by the pre-screen, whose requests are counted apart.
+
+    With a chunk_size the civic rows are processed chunk_size at a time, from
+    reading through requests and parsing, and the results of every chunk are
+    passed to on_chunk(signal_results) before the next chunk is read. Nothing
+    of a chunk is kept afterwards, so memory stays flat however large the
+    layer is, and the SignalResults returned is then empty. The results can
+    be read back a chunk at a time with StoredResults.
+
+    prescreen names a PathLossScreen model fitted on the responses stored by
+    previous runs. Civics it can classify against t_dbm with prescreen_margin
+    dB to spare are answered locally and flagged as estimated.
+    """
+    if feedback is None:
+        feedback = ConsoleFeedback()
+    if metrics is None:
+        metrics = PipelineMetrics()
+    if not os.path.exists(data_folder):
+        os.makedirs(data_folder)
+
+    # Raw responses and parsed results are checkpointed in a single SQLite
+    # file so requests made prior to a crash are not remade
+    network_name = network
+    best_path = checkpoint_path(data_folder, network_name)
+    feedback.pushInfo('Opening {} checkpoint store...'.format(best_path))
+    checkpoint = CheckpointStore(best_path, top_n)
+
+    # Responses are cached on a hash of the request parameters so re-runs
+    # and overlapping study areas only request locations not seen before
+    if not cache_folder:
+        cache_folder = '{}{}cloudrf_cache'.format(os.path.dirname(os.path.abspath(data_folder)),os.sep)
+    cache = ResponseCache(cache_folder, cache_ttl, cache_size)
+    if clear_cache:
+        feedback.pushInfo('Clearing cached {} responses...'.format(network_name))
+        cache.invalidate(network_name)
+        checkpoint.clear_responses(network_name)
+
+    # Checkpointed responses follow the expiry of the response cache
+    max_age = cache_ttl*86400 if cache_ttl > 0 else None
+
+    if snap_m:
+        feedback.pushInfo('Grouping civics on a {} m grid...'.format(snap_m))
+
+    # Towers seen by previous runs are kept in a registry updated from every
+    # response of this one
+    registry = TowerRegistry.load(checkpoint, network_name)
+    registered = len(registry)
+
+    # Civics far above or below the threshold are estimated locally with a
+    # path loss model fitted on the responses of previous runs
+    screen = None
+    if prescreen:
+        screen = PathLossScreen.from_checkpoint(checkpoint, network_name, registry, t_dbm, prescreen, prescreen_margin)
+        if screen is None:
+            feedback.pushInfo('Not enough stored {} responses to fit the pre-screen, requesting every civic...'.format(network_name))
+        else:
+            feedback.pushInfo('Pre-screening civics with the {} model fitted on {} signals of {} towers: {:.1f} dB per tenfold distance, {:.1f} dB spread, {} dB margin'.format(
+                prescreen, screen.samples, len(screen.names), -screen.slope, screen.spread, screen.margin))
+
+    # Parsed results are collected in columns for classification and
+    # tower statistics once all civics of a chunk are in
+    signal_results = SignalResults(top_n)
+
+    # The fingerprint of a civic covers its geometry, its attributes and the
+    # request parameters. In incremental mode civics whose fingerprint
+    # matches the manifest of the previous run reuse their stored results
+    previous = {}
+    unchanged = []
+    completed = {}
+    changed_count = 0
+    unchanged_count = 0
+
+    def changed_rows(rows):
+        nonlocal changed_count
+        for row in rows:
+            fingerprint = hashlib.sha1((fingerprints[row['civic']]+request_hash(dict(row, res=res))+(screen.key if screen else '')).encode('utf-8')).hexdigest()
+            fingerprints[row['civic']] = fingerprint
+            if previous.get(row['civic']) == fingerprint:
+                unchanged.append(row['civic'])
+            else:
+                changed_count += 1
+                yield row
+
+    engine = CloudRFRequestEngine(server, strict_ssl, concurrency, rate_limit, max_retries, retry_budget, timeout=timeout, gzip=gzip, limiter=limiter, slots=slots, metrics=metrics)
+    parser = ResponseParser(network, top_n, parse_workers)
+    if parse_workers > 1 and parser.pool is None:
+        feedback.pushInfo('Worker processes are not available when run from the QGIS processing toolbox, parsing responses in the QGIS process...')
+    responses = None
+    try:
+        n = 0
+        requests_made = 0
+        fan_out = {}
+        reporter = ProgressReporter(feedback, total, progress)
+
+        def parse(key, content):
+            with metrics.phase('parse'):
+                return parser.submit(key, content)
+
+        # Responses are parsed in chunks while requests are in flight and
+        # written out in the main thread as the chunks are finished
+        def handle_results(results):
+            for (row_hash, civics), (parsed, message, decoded, error) in results:
+                if parsed is not None:
+                    signal_results.add(civics, parsed, row_hash.startswith(ESTIMATE_PREFIX))
+                    registry.update(parsed[3])
+                elif decoded:
+                    # AddMessage Python error messages for use in QGIS
+                    feedback.pushInfo(message)
+                    for civic in civics:
+                        signal_results.add_error(civic, error)
+                else:
+                    feedback.pushInfo('Civic response: {}\n{}'.format(', '.join(civics), message))
+                checkpoint.put_result(row_hash, network_name, civics, parsed)
+                completed.update((civic, fingerprints[civic]) for civic in civics)
+
+        def handle_stored(row_hash, civics, content, parsed):
+            if parsed is None:
+                handle_results(parse((row_hash, civics), content))
+            else:
+                signal_results.add(civics, parsed, row_hash.startswith(ESTIMATE_PREFIX))
+                registry.update(parsed[3])
+                checkpoint.put_result(row_hash, network_name, civics, None)
+                completed.update((civic, fingerprints[civic]) for civic in civics)
+
+        def pending_rows(rows):
+            nonlocal n, estimated_requests
+            for batch in chunked(group_civics(changed_rows(rows), snap_m), SCREEN_BATCH):
+                # Rows missing from the checkpoint and the cache are collected
+                # by request hash and pre-screened together
+                missed = {}
+                for row, civics in batch:
+                    if feedback.isCanceled():
+                        return
+                    row_hash = request_hash(dict(row, res=res))
+
+                    # Civics sharing a request already in flight, such as repeated
+                    # civic IDs or duplicated addresses, wait for its response
+                    if row_hash in fan_out:
+                        fan_out[row_hash].extend(civics)
+                        continue
+                    if row_hash in missed:
+                        missed[row_hash][1].extend(civics)
+                        continue
+                    stored = checkpoint.lookup(row_hash, max_age)
+                    if stored is not None:
+                        n += len(civics)
+                        metrics.count('checkpoint_hits')
+                        handle_stored(row_hash, civics, *stored)
+                        reporter.update(len(civics), 'checkpointed')
+                        continue
+                    content = cache.get(network_name, row_hash)
+                    if content is not None:
+                        n += len(civics)
+                        checkpoint.put_response(row_hash, network_name, content)
+                        handle_results(parse((row_hash, civics), content))
+                        reporter.update(len(civics), 'cached')
+                        continue
+                    missed[row_hash] = (row, list(civics))
+
+                estimates = screen.estimate([row for row, civics in missed.values()]) if screen is not None else [None]*len(missed)
+                for (row_hash, (row, civics)), content in zip(missed.items(), estimates):
+                    if content is not None:
+                        n += len(civics)
+                        estimated_requests += 1
+                        metrics.count('estimated', len(civics))
+                        checkpoint.put_response(ESTIMATE_PREFIX+row_hash, network_name, content)
+                        handle_results(parse((ESTIMATE_PREFIX+row_hash, civics), content))
+                        reporter.update(len(civics), 'estimated')
+                    else:
+                        fan_out[row_hash] = civics
+                        yield row
+
+        # Request workers write each raw response to the checkpoint store
+        # as soon as it is received
+        def store_response(row, content):
+            if is_valid_response(content):
+                checkpoint.put_response(request_hash(dict(row, res=res)), network_name, content)
+
+        feedback.pushInfo('Requesting best signal with {} concurrent requests...'.format(engine.concurrency))
+        request_start = time.perf_counter()
+        estimated_requests = 0
+        checkpoint.reset_stage(network_name)
+        for chunk in (chunked(civic_rows, chunk_size) if chunk_size else [civic_rows]):
+            if incremental:
+                previous = checkpoint.manifest(network_name, [row['civic'] for row in chunk] if chunk_size else None, max_age)
+            responses = engine.run(pending_rows(chunk), feedback, store_response)
+            for row, content, error in responses:
+                row_hash = request_hash(dict(row, res=res))
+                civics = fan_out.pop(row_hash)
+                n += len(civics)
+                requests_made += 1
+                if error is not None:
+                    metrics.count('failed_requests')
+                    checkpoint.forget_civics(network_name, civics)
+                    # AddMessage Python error messages for use in QGIS
+                    feedback.pushInfo(format_exception(error, 'Property ID: {}\n'.format(', '.join(civics))))
+                    reporter.update(len(civics), 'failed')
+                    continue
+                cache.put(network_name, row_hash, content)
+                handle_results(parse((row_hash, civics), content))
+                reporter.update(len(civics), 'requested')
+
+            # Responses received up to a cancellation are kept in the checkpoint
+            # store so the next run picks up where this one stopped
+            if feedback.isCanceled():
+                registry.save(checkpoint, network_name)
+                checkpoint.flush()
+                feedback.pushInfo('Canceled after {} civics, {} responses are kept in the checkpoint store'.format(n, requests_made))
+                return None
+
+            # Unchanged civics are written from their stored results
+            for row_hash, civics, content, parsed in checkpoint.civic_results(network_name, unchanged):
+                handle_stored(row_hash, civics, content, parsed)
+                n += len(civics)
+                reporter.update(len(civics), 'unchanged')
+            unchanged_count += len(unchanged)
+            unchanged.clear()
+            with metrics.phase('parse'):
+                drained = parser.drain()
+            handle_results(drained)
+
+            # Civics that failed are staged without a fingerprint so the next
+            # incremental run requests them again
+            checkpoint.stage_manifest(network_name, {civic: completed.get(civic) for civic in fingerprints})
+            fingerprints.clear()
+            completed.clear()
+            if on_chunk is not None:
+                on_chunk(signal_results)
+                signal_results = SignalResults(top_n)
+        reporter.report()
+        metrics.add_time(request_phase, time.perf_counter()-request_start)
+        metrics.count('civics', n)
+        metrics.count('requests', requests_made)
+        # Lookups answered by the pre-screen were cache misses but made no request
+        metrics.count('cache_hits', cache.hits)
+        metrics.count('cache_misses', cache.misses-estimated_requests)
+        metrics.count('estimated_requests', estimated_requests)
+        feedback.pushInfo('Made {} CloudRF requests for {} civics, response cache hits: {}, misses: {}'.format(requests_made, n, cache.hits, cache.misses-estimated_requests))
+        if engine.retries:
+            feedback.pushInfo('Retried {} throttled or failed requests ({} retries allowed)'.format(engine.retries, engine.retry_budget))
+        if screen is not None:
+            feedback.pushInfo('Pre-screen estimated {} clearly good and {} clearly bad requests locally'.format(screen.good, screen.bad))
+        added = len(registry)-registered
+        moved = registry.save(checkpoint, network_name)-added
+        feedback.pushInfo('Tower registry holds {} towers, {} added and {} moved by this run'.format(len(registry), added, moved))
+
+        # Civics removed from the input layer are dropped from the checkpoint
+        # store in incremental runs
+        removed = checkpoint.commit_manifest(network_name, incremental)
+        if incremental:
+            feedback.pushInfo('Incremental run: {} changed, {} unchanged and {} removed civics'.format(changed_count, unchanged_count, removed))
+    finally:
+        # The request workers are stopped before the checkpoint store they
+        # write to is closed
+        if responses is not None:
+            responses.close()
+        engine.close()
+        parser.close()
+        checkpoint.close()
+        cache.close()
+    return signal_results
+
+
+class BestSignalSummary:
+    """
+    Classifies the N best signals of every civic against the threshold and
+    counts connections per tower in one vectorized pass, then holds the
+    attributes joined to the civics and towers, keyed by civic ID and tower
+    number, and the (tower, signal, chart url) of the servers of every civic.
+
+    The tower statistics are those of the TowerAggregates given, which hold
+    every chunk of a chunked run, or else of these results alone.
+    """
+
+    def __init__(self, signal_results, t_dbm, towers=None):
+        self.results = signal_results
+        self.t_dbm = float(t_dbm)
+        self.codes = [classify_signals(signal_results.column('signal', rank), t_dbm) for rank in range(signal_results.servers)]
+        self.good, self.marginal, self.bad = np.bincount(np.minimum(self.codes[0], 2)[self.codes[0] < 3], minlength=3).tolist()
+        if towers is None:
+            towers = TowerAggregates()
+            towers.add(signal_results, self.codes[0])
+        self.towers = towers
+
+        self.civic_attributes = {}
+        self.civic_servers = {}
+        columns = [signal_results.civics, signal_results.column('lat').tolist(), signal_results.column('lon').tolist()]
+        for rank in range(signal_results.servers):
+            columns.extend([signal_results.column('tower', rank).tolist(), signal_results.column('signal', rank).tolist(),
+                            QUALITY_LABELS[self.codes[rank]].tolist(), signal_results.url[rank], signal_results.column('distance', rank).tolist(),
+                            signal_results.column('azimuth', rank).tolist(), signal_results.column('tilt', rank).tolist()])
+        columns.append(signal_results.column('estimated').tolist())
+        for values in zip(*columns):
+            attributes = [values[1], values[2], self.t_dbm]
+            servers = []
+            for rank in range(signal_results.servers):
+                server = values[3+rank*7:10+rank*7]
+                if server[0] >= 0:
+                    attributes.append(signal_results.tower_names[server[0]])
+                    attributes.extend(server[1:])
+                    servers.append((server[0], server[1], server[3]))
+                else:
+                    attributes.extend([None]*7)
+            attributes.append(values[-1])
+            self.civic_attributes[values[0]] = attributes
+            self.civic_servers[values[0]] = servers
+        for civic, error in signal_results.errors:
+            self.civic_attributes[civic] = [None, -999] + [None]*(2+7*signal_results.servers)
+        self.missing_attributes = [None]*(4+7*signal_results.servers)
+
+        # Tower attributes by the tower numbers of these results
+        self.tower_attributes = [towers.attributes(towers.index[tower_name]) for tower_name in signal_results.tower_names]
+
+    def civic(self, civic):
+        """
+        Returns the attributes joined to a civic and the servers of the civic.
+        """
+        return self.civic_attributes.get(civic, self.missing_attributes), self.civic_servers.get(civic, [])
+
+    def server_rows(self):
+        """
+        Yields the long, normalized layout of the results with one row for each
+        civic and each of its servers, laid out as SERVER_TABLE_FIELDS after the
+        civic ID.
+        """
+        signal_results = self.results
+        estimated = signal_results.estimated
+        for rank in range(signal_results.servers):
+            tower = signal_results.column('tower', rank)
+            served = np.flatnonzero(tower >= 0)
+            server_columns = [tower[served].tolist()]
+            server_columns.extend(signal_results.column(name, rank)[served].tolist() for name in ('signal', 'distance', 'azimuth', 'tilt'))
+            quality = QUALITY_LABELS[self.codes[rank][served]].tolist()
+            for position, index in enumerate(served.tolist()):
+                yield [signal_results.civics[index], rank+1, signal_results.tower_names[server_columns[0][position]], server_columns[1][position],
+                       quality[position], signal_results.url[rank][index], server_columns[2][position], server_columns[3][position], server_columns[4][position],
+                       estimated[index]]
+
+
+# Fields of the threshold sweep comparison table, one row per threshold, and
+# of the tower statistics of every threshold
+SWEEP_FIELDS = [('threshold', float), ('Good_Con', int), ('Good_Pct', float), ('Margin_Con', int), ('Margin_Pct', float),
+                ('Bad_Con', int), ('Bad_Pct', float), ('Total_Con', int), ('Good_Towers', int)]
+
+SWEEP_TOWER_FIELDS = [('threshold', float)]+TOWER_RESULT_FIELDS
+
+
+class ThresholdSweep:
+    """
+    What-if classification of the best signal of every civic against several
+    thresholds at once. Each batch of signals is classified against all of the
+    thresholds in one broadcast pass and the Good, Marginal and Bad connections
+    are counted per threshold and tower with a single weighted bincount, so
+    civics sharing a response are counted without expanding them. Towers are
+    numbered in the order they are first seen.
+    """
+
+    def __init__(self, thresholds):
+        self.thresholds = np.array([float(threshold) for threshold in thresholds], dtype=np.float64)
+        self.tower_names = []
+        self.tower_index = {}
+        self.tower_coordinates = []
+        self.counts = np.zeros((len(self.thresholds), 64, 3), dtype=np.int64)
+
+    def tower(self, tower_name, coordinates):
+        """
+        Returns the number of a tower, adding it when first seen.
+        """
+        if tower_name not in self.tower_index:
+            if len(self.tower_names) == self.counts.shape[1]:
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)], axis=1)
+            self.tower_index[tower_name] = len(self.tower_names)
+            self.tower_names.append(tower_name)
+            self.tower_coordinates.append(tuple(coordinates))
+        return self.tower_index[tower_name]
+
+    def add(self, signal, tower, weights=None):
+        """
+        Adds the best signal of civics and the number of their best tower, -1
+        where there is none, each counted weights times.
+        """
+        if weights is None:
+            weights = np.ones(len(signal), dtype=np.float64)
+        codes = classify_signals(signal[np.newaxis, :], self.thresholds[:, np.newaxis])
+        served = (codes < 3) & (tower >= 0)[np.newaxis, :]
+        bins = (np.arange(len(self.thresholds))[:, np.newaxis]*self.counts.shape[1]+tower[np.newaxis, :])*3+np.minimum(codes, 2)
+        counts = np.bincount(bins[served], weights=np.broadcast_to(weights, codes.shape)[served], minlength=self.counts.size)
+        self.counts += np.rint(counts).astype(np.int64).reshape(self.counts.shape)
+
+    def add_checkpoint(self, checkpoint, network):
+        """
+        Adds the civics of the last run of a network stored in a CheckpointStore.
+        Only responses stored by another version are parsed again.
+        """
+        for batch in checkpoint.manifest_responses(network):
+            signal = np.full(len(batch), np.nan)
+            tower = np.full(len(batch), -1, dtype=np.int64)
+            weights = np.array([civics for civics, body, parsed in batch], dtype=np.float64)
+            for position, (civics, body, parsed) in enumerate(batch):
+                if parsed is None:
+                    parsed = parse_response(body, network, 1)[0]
+                if parsed is None or not parsed[2]:
+                    continue
+                rlat, rlon, sorted_dict, towers = parsed
+                tower_name, values = sorted_dict[0]
+                signal[position] = values[0]
+                tower[position] = self.tower(tower_name, towers[tower_name])
+            self.add(signal, tower, weights)
+
+    def towers(self, index):
+        """
+        Returns the TowerAggregates of the threshold at index.
+        """
+        return TowerAggregates.from_counts(self.tower_names, self.tower_coordinates, self.counts[index])
+
+    def rows(self):
+        """
+        Returns the comparison table of the thresholds, laid out as SWEEP_FIELDS.
+        """
+        rows = []
+        for index, threshold in enumerate(self.thresholds.tolist()):
+            good, marginal, bad = self.counts[index].sum(axis=0).tolist()
+            total = good+marginal+bad
+            good_towers = int((self.counts[index, :, 0] > 0).sum())
+            if total == 0:
+                rows.append([threshold]+[None]*6+[0, 0])
+            else:
+                rows.append([threshold, good, round(good/total, 4), marginal, round(marginal/total, 4), bad, round(bad/total, 4), total, good_towers])
+        return rows
+
+    def tower_rows(self):
+        """
+        Yields the (coordinates, attributes) of every tower at every threshold,
+        the attributes laid out as SWEEP_TOWER_FIELDS.
+        """
+        for index, threshold in enumerate(self.thresholds.tolist()):
+            towers = self.towers(index)
+            for tower in range(len(towers)):
+                yield towers.coordinates(tower), [threshold]+towers.attributes(tower)
+
+
+def threshold_ranges(t_dbm, good, marginal, bad, total):
+    """
+    Returns the (lower, upper, label, color) classes of the Good, Marginal and
+    Bad signals at a threshold, labelled with their share of the total civics.
+    """
+    threshold = float(t_dbm)
+    share = max(total, 1)
+    return [
+        (threshold, 0, 'Signals stronger than {} dBm ({}/{}) {}%'.format(t_dbm, good, total, round((good/share)*100,2)), '#0772f5'),
+        (threshold-10, threshold-0.001, 'Marginal signals between {} to {} dBm ({}/{}) {}%'.format(threshold-0.001, threshold-10, marginal, total, round((marginal/share)*100,2)), '#7e7e7e'),
+        (-1000, threshold-10.000000000000001, 'Signals weaker than {} dBm ({}/{}) {}%'.format(threshold-10.000000000000001, bad, total, round((bad/share)*100,2)), '#f58a07')]
+
+
+def graduated_style_qml(column, ranges, symbol_type='marker'):
+    """
+    Returns a QGIS layer style (QML) classifying a layer of marker or line
+    symbols on a numeric column into the given threshold_ranges, as the
+    algorithm styles its civics and spokes layers.
+    """
+    if symbol_type == 'line':
+        symbol_layer = '<layer class="SimpleLine" enabled="1" pass="0" locked="0"><prop k="line_color" v="{},255"/><prop k="line_width" v="0.5"/></layer>'
+    else:
+        symbol_layer = '<layer class="SimpleMarker" enabled="1" pass="0" locked="0"><prop k="color" v="{},255"/><prop k="name" v="circle"/><prop k="size" v="2"/></layer>'
+    lines = ["<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>",
+             '<qgis version="3.16" styleCategories="Symbology">',
+             '  <renderer-v2 type="graduatedSymbol" attr={} graduatedMethod="GraduatedColor" symbollevels="0" enableorderby="0" forceraster="0">'.format(quoteattr(column)),
+             '    <ranges>']
+    lines.extend('      <range lower="{}" upper="{}" symbol="{}" label={} render="true"/>'.format(lower, upper, number, quoteattr(label))
+                 for number, (lower, upper, label, color) in enumerate(ranges))
+    lines.extend(['    </ranges>', '    <symbols>'])
+    for number, (lower, upper, label, color) in enumerate(ranges):
+        rgb = ','.join(str(int(color[offset:offset+2], 16)) for offset in (1, 3, 5))
+        lines.append('      <symbol type="{}" name="{}" alpha="1" clip_to_extent="1" force_rhr="0">{}</symbol>'.format(symbol_type, number, symbol_layer.format(rgb)))
+    lines.extend(['    </symbols>', '  </renderer-v2>', '</qgis>', ''])
+    return '\n'.join(lines)
+
+
+def write_sweep(sweep, output_folder, name, extension='geojson', outputs=None):
+    """
+    Writes the comparison table of a ThresholdSweep and the tower statistics
+    of every threshold as a layer of towers with a threshold field. Returns
+    the paths of the files written by output name.
+
+    outputs, OutputLayers of the output folder by default, opens the writer
+    of each output, or None for outputs that are not wanted.
+    """
+    if outputs is None:
+        outputs = OutputLayers(output_folder, '{}_sweep'.format(name), extension)
+    table = outputs.open('thresholds', SWEEP_FIELDS)
+    if table is not None:
+        for row in sweep.rows():
+            table.add(None, row)
+        table.close()
+    towers = outputs.open('towers', SWEEP_TOWER_FIELDS, 'PointZ')
+    if towers is not None:
+        for coordinates, attributes in sweep.tower_rows():
+            towers.add(('Point', coordinates), attributes)
+        towers.close()
+    outputs.close()
+    return outputs.paths
+
+
+class StoredResults:
+    """
+    Reads the results of a chunked run back from its checkpoint store a chunk
+    of civics at a time, re-parsing responses stored by another version.
+    Civics whose request failed have no stored response and are missing. With
+    a ChartCache the charts of every chunk are downloaded and localized.
+    """
+
+    def __init__(self, path, network, servers, t_dbm, towers, charts=None):
+        self.network = network
+        self.servers = servers
+        self.t_dbm = t_dbm
+        self.towers = towers
+        self.charts = charts
+        self.checkpoint = CheckpointStore(path, servers)
+
+    def summary(self, civics):
+        """
+        Returns the BestSignalSummary of the given civics.
+        """
+        signal_results = SignalResults(self.servers)
+        for row_hash, found, content, parsed in self.checkpoint.civic_results(self.network, civics):
+            if parsed is None:
+                parsed, message, decoded, error = parse_response(content, self.network, self.servers)
+            if parsed is not None:
+                signal_results.add(found, parsed, row_hash.startswith(ESTIMATE_PREFIX))
+            else:
+                for civic in found:
+                    signal_results.add_error(civic, error)
+        if self.charts is not None:
+            self.charts.localize(signal_results)
+        return BestSignalSummary(signal_results, self.t_dbm, self.towers)
+
+    def close(self):
+        self.checkpoint.close()
+
+
+def summarize_results(signal_results, data_folder, network, servers, t_dbm, towers=None, charts=None, feedback=None, metrics=None):
+    """
+    Returns the BestSignalSummary of the results of a run or, given the
+    TowerAggregates of a chunked run, the StoredResults reading its civics
+    back from the checkpoint store. With a ChartCache the charts are
+    downloaded and localized, a chunk at a time for chunked runs.
+    """
+    if towers is not None:
+        return StoredResults(checkpoint_path(data_folder, network), network, servers, t_dbm, towers, charts)
+    if charts is not None:
+        with metrics.phase('charts') if metrics is not None else contextlib.nullcontext():
+            charts.localize(signal_results, feedback)
+    return BestSignalSummary(signal_results, t_dbm)
+
+
+def great_circle_points(lon1, lat1, lon2, lat2, segment_m=1000):
+    """
+    Returns the (lon, lat) vertices of the great circle between two points on a
+    spherical earth, one vertex about every segment_m metres.
+    """
+    phi1, lam1, phi2, lam2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    angle = 2*math.asin(min(1, math.sqrt(math.sin((phi2-phi1)/2)**2+math.cos(phi1)*math.cos(phi2)*math.sin((lam2-lam1)/2)**2)))
+    segments = max(1, int(math.ceil(angle*6371008.8/segment_m)))
+    if angle == 0:
+        return [(lon1, lat1), (lon2, lat2)]
+    points = []
+    for step in range(segments+1):
+        f = step/segments
+        a = math.sin((1-f)*angle)/math.sin(angle)
+        b = math.sin(f*angle)/math.sin(angle)
+        x = a*math.cos(phi1)*math.cos(lam1)+b*math.cos(phi2)*math.cos(lam2)
+        y = a*math.cos(phi1)*math.sin(lam1)+b*math.cos(phi2)*math.sin(lam2)
+        z = a*math.sin(phi1)+b*math.sin(phi2)
+        points.append((math.degrees(math.atan2(y, x)), math.degrees(math.atan2(z, math.hypot(x, y)))))
+    return points
+
+
+def read_gpkg_point(blob):
+    """
+    Returns the (x, y) of a GeoPackage point or the first point of a multipoint
+    geometry blob, or None for empty geometries.
+    """
+    flags = blob[3]
+    if flags & 0x10:
+        return None
+    envelope = (0, 32, 48, 48, 64)[(flags >> 1) & 0x07]
+    offset = 8+envelope
+    for depth in range(2):
+        order = '<' if blob[offset] == 1 else '>'
+        wkb_type = struct.unpack_from(order+'I', blob, offset+1)[0] & 0x0fffffff
+        if wkb_type % 1000 == 1:
+            return struct.unpack_from(order+'dd', blob, offset+5)
+        if wkb_type % 1000 != 4 or struct.unpack_from(order+'I', blob, offset+5)[0] == 0:
+            return None
+        offset += 9
+    return None
+
+
+def read_points(path, civic_field, layer=None, x_field='lon', y_field='lat'):
+    """
+    Reads the civic points of a GeoPackage layer, or of a CSV file with WGS84
+    coordinate columns. Returns the attribute field names and an iterator of
+    (civic, lon, lat, attributes) tuples. GeoPackage layers in another CRS are
+    reprojected in bulk, which needs pyproj.
+    """
+    if os.path.splitext(path)[1].lower() == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as csvfile:
+            field_names = next(csv.reader(csvfile))
+
+        def csv_points():
+            with open(path, newline='', encoding='utf-8-sig') as csvfile:
+                reader = csv.reader(csvfile)
+                next(reader)
+                for row in reader:
+                    values = dict(zip(field_names, row))
+                    yield civic_key(values[civic_field]), float(values[x_field]), float(values[y_field]), row
+        return field_names, csv_points()
+
+    connection = sqlite3.connect(path)
+    try:
+        layers = [name for name, in connection.execute("SELECT table_name FROM gpkg_contents WHERE data_type = 'features'")]
+        if not layers or (layer is not None and layer not in layers):
+            raise ValueError('No {} point layer in {}'.format(layer or 'feature', path))
+        table = layer or layers[0]
+        geometry_column, organization, srs_code, definition = connection.execute(
+            'SELECT g.column_name, s.organization, s.organization_coordsys_id, s.definition FROM gpkg_geometry_columns g '
+            'JOIN gpkg_spatial_ref_sys s ON s.srs_id = g.srs_id WHERE g.table_name = ?', (table,)).fetchone()
+        if (organization or '').upper() == 'EPSG':
+            transform = WGS84Transform('EPSG:{}'.format(srs_code))
+        else:
+            transform = WGS84Transform(definition)
+        field_names = [name for cid, name, *info in connection.execute('PRAGMA table_info("{}")'.format(table)) if name != geometry_column]
+    finally:
+        connection.close()
+
+    def gpkg_points():
+        connection = sqlite3.connect(path)
+        try:
+            columns = ', '.join('"{}"'.format(name) for name in field_names+[geometry_column])
+            civic_index = field_names.index(civic_field)
+            for row in connection.execute('SELECT {} FROM "{}"'.format(columns, table)):
+                point = read_gpkg_point(row[-1]) if row[-1] is not None else None
+                if point is None:
+                    continue
+                yield civic_key(row[civic_index]), point[0], point[1], list(row[:-1])
+        finally:
+            connection.close()
+    if transform.identity:
+        return field_names, gpkg_points()
+    return field_names, transform_points(gpkg_points(), transform)
+
+
+class FeatureWriter:
+    """
+    Writes features to a GeoJSON file, or to a CSV file holding the geometry as
+    WKT in a leading wkt column, chosen by the file extension. Geometries are
+    ('Point', (x, y[, z])) or ('LineString', [(x, y), ...]) tuples, or None for
+    tables.
+    """
+
+    def __init__(self, path, field_names):
+        self.path = path
+        self.field_names = list(field_names)
+        self.csv = os.path.splitext(path)[1].lower() == '.csv'
+        self.file = open(path, 'w', newline='' if self.csv else None, encoding='utf-8')
+        self.count = 0
+        if self.csv:
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(['wkt']+self.field_names)
+        else:
+            self.file.write('{"type": "FeatureCollection", "features": [\n')
+
+    def add(self, geometry, values):
+        values = [None if isinstance(value, float) and math.isnan(value) else value for value in values]
+        if self.csv:
+            kind, coordinates = geometry or (None, None)
+            if kind is None:
+                wkt = ''
+            elif kind == 'Point':
+                wkt = 'POINT{} ({})'.format(' Z' if len(coordinates) > 2 else '', ' '.join(map(repr, coordinates)))
+            else:
+                wkt = 'LINESTRING ({})'.format(', '.join(' '.join(map(repr, point)) for point in coordinates))
+            self.writer.writerow([wkt]+values)
+        else:
+            feature = {'type': 'Feature', 'geometry': {'type': geometry[0], 'coordinates': geometry[1]} if geometry else None,
+                       'properties': dict(zip(self.field_names, values))}
+            self.file.write('{}{}'.format(',\n' if self.count else '', json.dumps(feature, default=str)))
+        self.count += 1
+
+    def close(self):
+        if not self.csv:
+            self.file.write('\n]}\n')
+        self.file.close()
+
+
+def unique_field_names(names):
+    """
+    Returns the field names with a numeric suffix added to any name already
+    present, ignoring case, the way QGIS names joined fields.
+    """
+    unique = []
+    seen = set()
+    for name in names:
+        field_name = name
+        suffix = 2
+        while field_name.lower() in seen:
+            field_name = '{}_{}'.format(name, suffix)
+            suffix += 1
+        seen.add(field_name.lower())
+        unique.append(field_name)
+    return unique
+
+
+def ogr_dataset(path, driver):
+    """
+    Creates a GDAL/OGR dataset with one of its vector drivers, replacing an
+    existing file.
+    """
+    if ogr is None:
+        raise ValueError('{} output needs the GDAL Python bindings (osgeo), as installed with QGIS'.format(driver))
+    if os.path.exists(path):
+        os.remove(path)
+    return ogr.GetDriverByName(driver).CreateDataSource(path)
+
+
+class OGRWriter:
+    """
+    Writes a WGS84 layer, or a table without geometries, through GDAL/OGR
+    with the add() and close() of FeatureWriter. Used for FlatGeobuf, whose
+    packed Hilbert R-tree is built by GDAL when the file is closed, and for
+    the layers of a GeoPackage, which GDAL writes with an R-tree spatial
+    index. The layer is added to dataset when given, else to a new dataset
+    of driver at path. Features are written in transactions of BATCH.
+    """
+
+    BATCH = 1000
+
+    def __init__(self, path, fields, geometry_type, driver='FlatGeobuf', dataset=None, layer_name=None):
+        self.owned = dataset is None
+        self.dataset = ogr_dataset(path, driver) if dataset is None else dataset
+        srs = None
+        if geometry_type is not None:
+            srs = osr.SpatialReference()
+            srs.ImportFromEPSG(4326)
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        kinds = {'Point': ogr.wkbPoint, 'PointZ': ogr.wkbPoint25D, 'LineString': ogr.wkbLineString, None: ogr.wkbNone}
+        options = ['SPATIAL_INDEX=YES'] if geometry_type is not None else []
+        self.layer = self.dataset.CreateLayer(layer_name or os.path.splitext(os.path.basename(path))[0], srs, kinds[geometry_type], options)
+        self.field_names = unique_field_names([field for field, kind in fields])
+        for field, (name, kind) in zip(self.field_names, fields):
+            self.layer.CreateField(ogr.FieldDefn(field, {str: ogr.OFTString, float: ogr.OFTReal, int: ogr.OFTInteger64}.get(kind, ogr.OFTString)))
+        self.definition = self.layer.GetLayerDefn()
+        self.count = 0
+        self.layer.StartTransaction()
+
+    def add(self, geometry, values):
+        feature = ogr.Feature(self.definition)
+        if geometry is not None:
+            kind, coordinates = geometry
+            shape = ogr.Geometry(ogr.wkbPoint25D if kind == 'Point' and len(coordinates) > 2 else ogr.wkbPoint if kind == 'Point' else ogr.wkbLineString)
+            for point in ([coordinates] if kind == 'Point' else coordinates):
+                shape.AddPoint(*point)
+            feature.SetGeometry(shape)
+        for index, value in enumerate(values):
+            if value is not None and not (isinstance(value, float) and math.isnan(value)):
+                feature.SetField(index, value if isinstance(value, (int, float)) else str(value))
+        self.layer.CreateFeature(feature)
+        self.count += 1
+        if self.count % self.BATCH == 0:
+            self.layer.CommitTransaction()
+            self.layer.StartTransaction()
+
+    def close(self):
+        self.layer.CommitTransaction()
+        self.layer = None
+        if self.owned:
+            self.dataset = None
+
+
+class OutputLayers:
+    """
+    Opens the output layers of a run in one of the OUTPUT_FORMATS: GeoJSON or
+    CSV files, FlatGeobuf files with a packed R-tree or a single GeoPackage
+    holding every layer and table with R-tree indexes, both written by GDAL.
+    Tables without geometries are written as CSV next to FlatGeobuf layers.
+    paths holds the file written for every output.
+    """
+
+    FORMATS = ('geojson', 'csv', 'gpkg', 'fgb')
+
+    def __init__(self, output_folder, name, extension='geojson'):
+        if extension not in self.FORMATS:
+            raise ValueError('Unknown output format {}'.format(extension))
+        self.output_folder = output_folder
+        self.name = name
+        self.extension = extension
+        self.paths = {}
+        self.package = None
+        if extension == 'gpkg':
+            self.package_path = os.path.join(output_folder, '{}.gpkg'.format(name))
+            self.package = ogr_dataset(self.package_path, 'GPKG')
+
+    def open(self, output, fields, geometry_type=None):
+        """
+        Opens the writer of an output of (name, type) fields.
+        """
+        if self.package is not None:
+            self.paths[output] = self.package_path
+            return OGRWriter(self.package_path, fields, geometry_type, dataset=self.package, layer_name=output)
+        extension = self.extension
+        if extension == 'fgb' and geometry_type is None:
+            extension = 'csv'
+        path = os.path.join(self.output_folder, '{}_{}.{}'.format(self.name, output, extension))
+        self.paths[output] = path
+        if extension == 'fgb':
+            return OGRWriter(path, fields, geometry_type)
+        return FeatureWriter(path, [field for field, kind in fields])
+
+    def close(self):
+        if self.package is not None:
+            self.package.FlushCache()
+            self.package = None
+
+
+class SinkWriter:
+    """
+    Writes features to a QGIS feature sink in batches, with the add() and
+    close() of FeatureWriter. Geometries are FeatureWriter tuples, or
+    QgsGeometry objects written as they are.
+    """
+
+    BATCH = 1000
+
+    def __init__(self, sink, fields):
+        self.sink = sink
+        self.fields = fields
+        self.batch = []
+
+    def add(self, geometry, values):
+        feature = QgsFeature(self.fields)
+        if isinstance(geometry, tuple):
+            kind, coordinates = geometry
+            if kind == 'Point':
+                geometry = QgsGeometry(QgsPoint(*coordinates))
+            else:
+                geometry = QgsGeometry.fromPolylineXY([QgsPointXY(point[0], point[1]) for point in coordinates])
+        if geometry is not None:
+            feature.setGeometry(geometry)
+        feature.setAttributes(list(values))
+        self.batch.append(feature)
+        if len(self.batch) >= self.BATCH:
+            self.sink.addFeatures(self.batch, QgsFeatureSink.FastInsert)
+            self.batch = []
+
+    def close(self):
+        self.sink.addFeatures(self.batch, QgsFeatureSink.FastInsert)
+        self.batch = []
+        # The sink is finalized once it is no longer referenced
+        self.sink = None
+
+
+class SinkLayers:
+    """
+    Opens the outputs of write_outputs and write_sweep as the feature sinks of
+    a processing algorithm, the QGIS counterpart of OutputLayers. sinks maps
+    output names to sink parameters, optional outputs left unset are not
+    opened. Fields named after a field of source keep its type and point
+    layers take its geometry type. paths holds the destination of every
+    output written and results the same by sink parameter.
+    """
+
+    def __init__(self, algorithm, parameters, context, sinks, source=None):
+        self.algorithm = algorithm
+        self.parameters = parameters
+        self.context = context
+        self.sinks = sinks
+        self.source = source
+        self.paths = {}
+        self.results = {}
+
+    def open(self, output, fields, geometry_type=None):
+        """
+        Opens the writer of an output of (name, type) fields, or returns None
+        when the output is not wanted.
+        """
+        source_fields = self.source.fields() if self.source is not None else QgsFields()
+        sink_fields = QgsFields()
+        for name, kind in fields:
+            index = source_fields.lookupField(name)
+            append_unique_fields(sink_fields, [source_fields.at(index)] if index != -1 else qgs_fields([(name, kind)]))
+        kinds = {'Point': self.source.wkbType() if self.source is not None else QgsWkbTypes.Point, 'PointZ': QgsWkbTypes.PointZ,
+                 'LineString': QgsWkbTypes.LineString, None: QgsWkbTypes.NoGeometry}
+        (sink, dest_id) = self.algorithm.parameterAsSink(self.parameters, self.sinks[output], self.context, sink_fields, kinds[geometry_type],
+                                                         QgsCoordinateReferenceSystem('EPSG:4326'))
+        if sink is None:
+            return None
+        self.paths[output] = dest_id
+        self.results[self.sinks[output]] = dest_id
+        return SinkWriter(sink, sink_fields)
+
+    def close(self):
+        pass
+
+
+def write_outputs(points, field_names, civic_field, network, summary, output_folder, name, extension='geojson',
+                  spokes_all_servers=False, geodesic=False, server_table=False, chunk_size=1000, outputs=None, feedback=None):
+    """
+    Writes the civics with their signal strength fields, the towers with their
+    connection statistics, the spokes from each civic to its best tower, or to
+    all of its best towers, and optionally the table of civics and their best
+    servers. Returns the paths of the files written by output name.
+
+    points are (civic, lon, lat, attributes) tuples, optionally followed by
+    the geometry written for the civic in place of its point.
+
+    extension is one of the OutputLayers.FORMATS, with gpkg every output is a
+    layer of a single GeoPackage. outputs, OutputLayers of the output folder
+    by default, opens the writer of each output, or None for outputs that are
+    not wanted. Writing stops at the next chunk once feedback is canceled.
+
+    summary is a BestSignalSummary, or the StoredResults of a chunked run which
+    are then read back chunk_size civics at a time as the points are written.
+    """
+    stored = isinstance(summary, StoredResults)
+    prefix = network_prefix(network)
+    servers = summary.servers if stored else summary.results.servers
+    civic_fields = [(field, str) for field in field_names]+civic_result_fields(prefix, servers)
+    if outputs is None:
+        outputs = OutputLayers(output_folder, name, extension)
+
+    towers = outputs.open('towers', TOWER_RESULT_FIELDS, 'PointZ')
+    for index in range(len(summary.towers)):
+        towers.add(('Point', summary.towers.coordinates(index)), summary.towers.attributes(index))
+    towers.close()
+
+    spoke_servers = None if spokes_all_servers else 1
+    civics = outputs.open('civics', civic_fields, 'Point')
+    spokes = outputs.open('spokes', civic_fields+TOWER_RESULT_FIELDS+SPOKE_RESULT_FIELDS, 'LineString')
+    table = None
+    if server_table:
+        table = outputs.open('servers', [(civic_field, str)]+SERVER_TABLE_FIELDS)
+    for chunk in chunked(points, chunk_size):
+        if feedback is not None and feedback.isCanceled():
+            break
+        chunk_summary = summary.summary([point[0] for point in chunk]) if stored else summary
+        for civic, lon, lat, values, *geometry in chunk:
+            attributes, servers = chunk_summary.civic(civic)
+            attributes = list(values)+attributes
+            civics.add(geometry[0] if geometry else ('Point', (lon, lat)), attributes)
+            for rank, (tower, signal, url) in enumerate(servers[:spoke_servers]):
+                x, y, z = chunk_summary.results.tower_coordinates[tower]
+                line = great_circle_points(lon, lat, x, y) if geodesic else [(lon, lat), (x, y)]
+                spokes.add(('LineString', line), attributes+chunk_summary.tower_attributes[tower]+[rank+1, signal, url])
+        if stored and table is not None:
+            for row in chunk_summary.server_rows():
+                table.add(None, row)
+    civics.close()
+    spokes.close()
+
+    if table is not None:
+        if not stored:
+            for row in summary.server_rows():
+                table.add(None, row)
+        table.close()
+    outputs.close()
+    return outputs.paths
+
+
+# Fields of the civics, towers and spokes merged over several networks, the
+# best server of every civic over all of the networks is kept
+MERGED_CIVIC_FIELDS = [('civic_lat', float), ('civic_lon', float), ('target', float), ('best_net', str), ('best_tower', str),
+                       ('best_S', float), ('best_QoC', str), ('best_url', str), ('best_dis', float), ('best_azi', float),
+                       ('best_tlt', float), ('networks', int)]
+
+MERGED_TOWER_FIELDS = [('Network', str)]+TOWER_RESULT_FIELDS
+
+
+class MergedSummary:
+    """
+    Merges the results of several networks and shards, given as (network,
+    SignalResults) tuples, into the best server of every civic over all of the
+    networks and a single tower layer. Towers are counted and classified on the
+    civics they serve best over all networks, and the attributes are laid out
+    as MERGED_CIVIC_FIELDS and MERGED_TOWER_FIELDS.
+    """
+
+    def __init__(self, results, t_dbm):
+        self.t_dbm = float(t_dbm)
+        self.tower_attributes = []
+        self.tower_coordinates = []
+        civics = []
+        columns = {name: [] for name in ('lat', 'lon', 'signal', 'distance', 'azimuth', 'tilt')}
+        towers = []
+        urls = []
+        networks = []
+        tower_index = {}
+        for network, signal_results in results:
+            # Shards of a network number their towers on their own, so towers
+            # are renumbered on their network and name
+            renumber = []
+            for index, tower_name in enumerate(signal_results.tower_names):
+                if (network, tower_name) not in tower_index:
+                    tower_index[(network, tower_name)] = len(self.tower_coordinates)
+                    self.tower_attributes.append([network, tower_name.replace('_',' ')]+list(signal_results.tower_coordinates[index]))
+                    self.tower_coordinates.append(signal_results.tower_coordinates[index])
+                renumber.append(tower_index[(network, tower_name)])
+            tower = signal_results.column('tower')
+            civics.extend(signal_results.civics)
+            towers.append(np.where(tower >= 0, np.array(renumber+[-1], dtype=np.int64)[tower], -1))
+            urls.extend(signal_results.url[0])
+            networks.extend([network]*len(signal_results))
+            for name in columns:
+                columns[name].append(signal_results.column(name))
+        if not civics:
+            civics_codes = np.zeros(0, dtype=np.int64)
+            unique_civics = []
+        else:
+            unique_civics, civics_codes = np.unique(np.array(civics, dtype=object).astype(str), return_inverse=True)
+        columns = {name: np.concatenate(values) if values else np.zeros(0) for name, values in columns.items()}
+        tower = np.concatenate(towers) if towers else np.zeros(0, dtype=np.int64)
+        signal = columns['signal']
+
+        # Sorting on the civic and then on the strongest signal puts the best
+        # server of every civic first, civics without a signal sort last
+        order = np.lexsort((-signal, civics_codes))
+        first = order[np.r_[True, civics_codes[order][1:] != civics_codes[order][:-1]]] if len(order) else order
+        counts = np.bincount(civics_codes, minlength=len(unique_civics))
+        codes = classify_signals(signal[first], t_dbm)
+        self.good, self.marginal, self.bad = np.bincount(np.minimum(codes, 2)[codes < 3], minlength=3).tolist()
+
+        best_tower = tower[first]
+        served = best_tower >= 0
+        tower_counts = np.bincount(best_tower[served]*3+np.minimum(codes[served], 2), minlength=len(self.tower_coordinates)*3).reshape(-1, 3)
+        totals = tower_counts.sum(axis=1)
+        percentages = np.round(tower_counts/np.maximum(totals, 1)[:, None], 4)
+        for index, attributes in enumerate(self.tower_attributes):
+            if totals[index] == 0:
+                attributes.extend([None]*7)
+            else:
+                good, marginal, bad = tower_counts[index].tolist()
+                good_pct, marginal_pct, bad_pct = percentages[index].tolist()
+                attributes.extend([good, good_pct, marginal, marginal_pct, bad, bad_pct, int(totals[index])])
+
+        self.civic_attributes = {}
+        self.civic_servers = {}
+        quality = QUALITY_LABELS[codes].tolist()
+        for position, index in enumerate(first.tolist()):
+            civic = civics[index]
+            if tower[index] >= 0:
+                self.civic_attributes[civic] = [columns['lat'][index], columns['lon'][index], self.t_dbm, networks[index],
+                                                self.tower_attributes[tower[index]][1], signal[index], quality[position], urls[index],
+                                                columns['distance'][index], columns['azimuth'][index], columns['tilt'][index],
+                                                int(counts[civics_codes[index]])]
+                self.civic_servers[civic] = [(int(tower[index]), signal[index], urls[index])]
+            else:
+                self.civic_attributes[civic] = [columns['lat'][index], columns['lon'][index], self.t_dbm]+[None]*8+[int(counts[civics_codes[index]])]
+        self.missing_attributes = [None]*len(MERGED_CIVIC_FIELDS)
+
+    def civic(self, civic):
+        """
+        Returns the attributes joined to a civic and its best server.
+        """
+        return self.civic_attributes.get(civic, self.missing_attributes), self.civic_servers.get(civic, [])
+
+
+class PrefixedFeedback:
+    """
+    Feedback of one job of a batch, prefixing its messages with the job name.
+    """
+
+    def __init__(self, feedback, prefix):
+        self.feedback = feedback
+        self.prefix = prefix
+
+    def pushInfo(self, message):
+        self.feedback.pushInfo('[{}] {}'.format(self.prefix, message))
+
+    def isCanceled(self):
+        return self.feedback.isCanceled()
+
+
+def shard_of(lon, lat, shard_size=None):
+    """
+    Returns the name of the square shard of shard_size degrees holding a point,
+    or 'all' when the layer is not sharded.
+    """
+    if not shard_size:
+        return 'all'
+    return '{}_{}'.format(int(math.floor(lon/shard_size)), int(math.floor(lat/shard_size)))
+
+
+def run_batch(path, civic_field, networks, uid, key, output_folder, name='batch', layer=None, x_field='lon', y_field='lat',
+              t_dbm='-65', rxh='', rxg='', res='30', shard_size=None, jobs=4, concurrency=8, rate_limit=4.0, extension='geojson',
+              feedback=None, **options):
+    """
+    Runs the analysis of every network over every spatial shard of a civic layer
+    as parallel jobs, then writes the best server of every civic over all of the
+    networks, a single tower layer of every network and the spokes from each
+    civic to its best tower. Returns the paths of the files written.
+
+    All jobs share one rate limiter and at most concurrency requests are in
+    flight at any time over the whole batch. Every job keeps its own checkpoint
+    store in the data folder so shards and networks can be resumed on their own.
+    The other options are passed on to best_signal_analysis.
+    """
+    if feedback is None:
+        feedback = ConsoleFeedback()
+    shards = {}
+    for civic, lon, lat, attributes in read_points(path, civic_field, layer, x_field, y_field)[1]:
+        shard = shard_of(lon, lat, shard_size)
+        shards[shard] = shards.get(shard, 0)+1
+    feedback.pushInfo('Running {} networks over {} shards of {} civics with {} jobs...'.format(len(networks), len(shards), sum(shards.values()), jobs))
+
+    limiter = TokenBucketRateLimiter(rate_limit)
+    slots = threading.BoundedSemaphore(max(1, int(concurrency)))
+    data_folder = os.path.join(output_folder, '{}_data'.format(name))
+    if not options.get('cache_folder'):
+        options['cache_folder'] = os.path.join(output_folder, 'cloudrf_cache')
+
+    # Every job shares the response cache, so it is cleared once here rather
+    # than by each job over the responses its sibling shards just cached
+    if options.get('clear_cache'):
+        cache = ResponseCache(options['cache_folder'], options.get('cache_ttl', 30), options.get('cache_size', 1024))
+        for network in networks:
+            feedback.pushInfo('Clearing cached {} responses...'.format(network))
+            cache.invalidate(network)
+            for shard in shards:
+                shard_checkpoint = checkpoint_path(os.path.join(data_folder, network, shard), network)
+                if os.path.exists(shard_checkpoint):
+                    checkpoint = CheckpointStore(shard_checkpoint)
+                    checkpoint.clear_responses(network)
+                    checkpoint.close()
+        cache.close()
+        options['clear_cache'] = False
+
+    def run_job(network, shard):
+        points = (point for point in read_points(path, civic_field, layer, x_field, y_field)[1] if shard_of(point[1], point[2], shard_size) == shard)
+        fingerprints = {}
+        civic_rows = iter_point_rows(points, uid, key, rxh, rxg, network, fingerprints)
+        return best_signal_analysis(civic_rows, fingerprints, network, res, os.path.join(data_folder, network, shard), concurrency=concurrency,
+                                    feedback=PrefixedFeedback(feedback, '{} {}'.format(network, shard)), total=shards[shard],
+                                    limiter=limiter, slots=slots, t_dbm=t_dbm, request_phase='request_{}_{}'.format(network, shard), **options)
+
+    # Jobs run in parallel, so each reports its own request phase and the
+    # request phase of the batch is the wall time of all of them
+    metrics = options.get('metrics')
+    if metrics is not None:
+        metrics.lap()
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, int(jobs))) as executor:
+        futures = {executor.submit(run_job, network, shard): (network, shard) for network in networks for shard in shards}
+        try:
+            for future in futures:
+                network, shard = futures[future]
+                signal_results = future.result()
+                if signal_results is None:
+                    return None
+                results.append((network, signal_results))
+                feedback.pushInfo('Finished {} shard {}'.format(network, shard))
+        except KeyboardInterrupt:
+            # Stops the jobs still running so their checkpoints are closed
+            feedback.cancel()
+            raise
+
+    if metrics is not None:
+        metrics.lap('request')
+    summary = MergedSummary(results, t_dbm)
+    if metrics is not None:
+        metrics.lap('aggregate')
+    field_names, points = read_points(path, civic_field, layer, x_field, y_field)
+    civic_fields = [(field, str) for field in field_names]+MERGED_CIVIC_FIELDS
+    outputs = OutputLayers(output_folder, name, extension)
+
+    towers = outputs.open('towers', MERGED_TOWER_FIELDS, 'PointZ')
+    for index, attributes in enumerate(summary.tower_attributes):
+        towers.add(('Point', tuple(summary.tower_coordinates[index])), attributes)
+    towers.close()
+
+    civics = outputs.open('civics', civic_fields, 'Point')
+    spokes = outputs.open('spokes', civic_fields+MERGED_TOWER_FIELDS, 'LineString')
+    for civic, lon, lat, values in points:
+        attributes, servers = summary.civic(civic)
+        attributes = list(values)+attributes
+        civics.add(('Point', (lon, lat)), attributes)
+        for tower, signal, url in servers:
+            x, y, z = summary.tower_coordinates[tower]
+            spokes.add(('LineString', [(lon, lat), (x, y)]), attributes+summary.tower_attributes[tower])
+    civics.close()
+    spokes.close()
+    outputs.close()
+    feedback.pushInfo('{} good, {} marginal and {} bad connections over all networks'.format(summary.good, summary.marginal, summary.bad))
+    return outputs.paths
+
+
+def run_sweep(output_folder, name, networks, thresholds, data_folder, extension='geojson', styles=False, feedback=None):
+    """
+    Classifies the civics of the last run of every network against each of the
+    thresholds from the results stored in the checkpoints of the data folder,
+    without requesting or parsing them again, then writes the comparison table
+    and tower statistics of every network. The checkpoints of every shard of
+    a batch are combined. With styles a style of the civics output classified
+    at each threshold is written next to it. Returns the paths of the files
+    written.
+    """
+    if feedback is None:
+        feedback = ConsoleFeedback()
+    paths = {}
+    for network in networks:
+        checkpoints = glob.glob(checkpoint_path(data_folder, network))+glob.glob(checkpoint_path(os.path.join(data_folder, network, '*'), network))
+        if not checkpoints:
+            raise ValueError('No stored results of {} in {}, run the analysis first'.format(network, data_folder))
+        sweep = ThresholdSweep(thresholds)
+        for path in checkpoints:
+            checkpoint = CheckpointStore(path)
+            try:
+                sweep.add_checkpoint(checkpoint, network)
+            finally:
+                checkpoint.close()
+        sweep_name = name if len(networks) == 1 else '{}_{}'.format(name, network)
+        for output, path in write_sweep(sweep, output_folder, sweep_name, extension).items():
+            paths['{}_{}'.format(network, output)] = path
+        for threshold, good, good_pct, marginal, marginal_pct, bad, bad_pct, total, good_towers in sweep.rows():
+            feedback.pushInfo('{} at {:g} dBm: {} good, {} marginal and {} bad connections, {} towers with good connections'.format(
+                network, threshold, good or 0, marginal or 0, bad or 0, good_towers))
+            if styles:
+                path = os.path.join(output_folder, '{}_civics_{:g}dBm.qml'.format(sweep_name, threshold))
+                with open(path, 'w', encoding='utf-8') as qmlfile:
+                    qmlfile.write(graduated_style_qml('{}_S1'.format(network_prefix(network)), threshold_ranges('{:g}'.format(threshold), good or 0, marginal or 0, bad or 0, total or 0)))
+                paths['{}_style_{:g}'.format(network, threshold)] = path
+    return paths
+
+
+def create_spatial_indexes(dest_ids, context):
+    """
+    Indexes the output layers written without a spatial index, such as
+    shapefiles and temporary layers, so they draw and query quickly.
+    """
+    for dest_id in dest_ids:
+        provider = QgsProcessingUtils.mapLayerFromString(dest_id, context).dataProvider()
+        if provider.capabilities() & QgsVectorDataProvider.CreateSpatialIndex and provider.hasSpatialIndex() != QgsFeatureSource.SpatialIndexPresent:
+            provider.createSpatialIndex()
+
+
+def style_signal_layer(layer, column, ranges, map_tip, width=None):
+    """
+    Classifies a civics or spokes layer on a signal column into the given
+    threshold_ranges and sets its map tip.
+    """
+    range_list = []
+    for lower, upper, label, color in ranges:
+        symbol = QgsSymbol.defaultSymbol(layer.geometryType())
+        symbol.setColor(QtGui.QColor(color))
+        if width is not None:
+            symbol.setWidth(width)
+        range_list.append(QgsRendererRange(lower, upper, symbol, label))
+    renderer = QgsGraduatedSymbolRenderer('', range_list)
+    renderer.setClassAttribute(column)
+    layer.setRenderer(renderer)
+    layer.setMapTipTemplate(map_tip)
+    layer.triggerRepaint()
+
+
+def civic_map_tip(network):
+    # Map tip displaying the path profile chart from CloudRF
+    return """<img src = "[% "{}S1_url" %]" width="600" />""".format(network_prefix(network))
+
+
+def style_outputs(civics_layer, towers_layer, spokes_layer, network, ranges):
+    """
+    Styles the civics on the signal of their best server and the spokes on the
+    signal of the server they connect to, with map tips of their path profile
+    charts, and labels the towers.
+    """
+    style_signal_layer(civics_layer, '{}_S1'.format(network_prefix(network)), ranges, civic_map_tip(network))
+    spoke_fields = spokes_layer.fields()
+    style_signal_layer(spokes_layer, spoke_fields.at(spoke_fields.count()-2).name(), ranges,
+                       """<img src = "[% "{}" %]" width="600" />""".format(spoke_fields.at(spoke_fields.count()-1).name()), .5)
+
+    # Setting labels for Wireless Towers
+    layer_settings  = QgsPalLayerSettings()
+    layer_settings.fieldName = "Tower"
+    layer_settings.enabled = True
+    layer_settings = QgsVectorLayerSimpleLabeling(layer_settings)
+
+    buffer_settings = QgsTextBufferSettings()
+    buffer_settings.setEnabled(True)
+    buffer_settings.setSize(1)
+    buffer_settings.setColor(QtGui.QColor('white'))
+
+    tower_symbol = QgsSvgMarkerSymbolLayer('https://upload.wikimedia.org/wikipedia/commons/d/db/Octicons-radio-tower.svg')
+    towers_layer.renderer().symbol().changeSymbolLayer(0, tower_symbol)
+    towers_layer.renderer().symbol().setSize(6)
+    towers_layer.setLabelsEnabled(True)
+    towers_layer.setLabeling(layer_settings)
+    towers_layer.triggerRepaint()
+
+
+def sweep_civics_layer(civics_layer, network, threshold, ranges):
+    """
+    Returns a copy of the civics layer classified into the threshold_ranges of
+    another threshold.
+    """
+    if civics_layer.providerType() == 'memory':
+        layer = civics_layer.materialize(QgsFeatureRequest())
+    else:
+        layer = civics_layer.clone()
+    layer.setName('Civics at {:g} dBm'.format(threshold))
+    style_signal_layer(layer, '{}_S1'.format(network_prefix(network)), ranges, civic_map_tip(network))
+    return layer
 
-# server="https://cloudrf.com"
-# strictSSL=True
 
 class BestSignalProcessingAlgorithm(QgsProcessingAlgorithm):
 
@@ -44,9 +3396,38 @@ class BestSignalProcessingAlgorithm(QgsProcessingAlgorithm):
     RXG = 'rxg'
     ANT = 'ant'
     RES = 'res'
+    CONCURRENCY = 'concurrency'
+    RATE_LIMIT = 'rate_limit'
+    MAX_RETRIES = 'max_retries'
+    RETRY_BUDGET = 'retry_budget'
+    TIMEOUT = 'timeout'
+    GZIP = 'gzip'
+    CACHE_FOLDER = 'cache_folder'
+    CACHE_TTL = 'cache_ttl'
+    CACHE_SIZE = 'cache_size'
+    CLEAR_CACHE = 'clear_cache'
+    DEDUPLICATE = 'deduplicate'
+    SNAP_CELLS = 'snap_cells'
+    INCREMENTAL = 'incremental'
+    PARSE_WORKERS = 'parse_workers'
+    CHUNK_SIZE = 'chunk_size'
+    PREFETCH_CHARTS = 'prefetch_charts'
+    CHART_CACHE_SIZE = 'chart_cache_size'
+    PRESCREEN = 'prescreen'
+    PRESCREEN_MARGIN = 'prescreen_margin'
+    TOP_N = 'top_n'
+    SPOKES_ALL_SERVERS = 'spokes_all_servers'
+    GEODESIC = 'geodesic'
     OUTPUT_CIVICS = 'output_civics'
     OUTPUT_TOWERS = 'output_towers'
     OUTPUT_SPOKES = 'output_spokes'
+    OUTPUT_SERVERS = 'output_servers'
+    OUTPUT_METRICS = 'output_metrics'
+    OUTPUT_PACKAGE = 'output_package'
+    SWEEP_THRESHOLDS = 'sweep_thresholds'
+    SWEEP_LAYERS = 'sweep_layers'
+    OUTPUT_SWEEP = 'output_sweep'
+    OUTPUT_SWEEP_TOWERS = 'output_sweep_towers'
 
 
     # Remove Default values for INPUT, API Key, UID, ANT, OUTPUT
@@ -62,6 +3443,18 @@ class BestSignalProcessingAlgorithm(QgsProcessingAlgorithm):
             QgsProcessingParameterString(self.NETWORK,'Network name from CloudRF to test for coverage with (i.e. LTE_Pictou)')
         )
 
+        adv_param = QgsProcessingParameterNumber(self.TOP_N,'Number of best servers to keep for each civic',QgsProcessingParameterNumber.Integer,2,False,1,10)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterBoolean(self.SPOKES_ALL_SERVERS,'Draw spokes to all of the best servers of each civic, not only the best one',False)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterBoolean(self.GEODESIC,'Draw spokes as geodesic lines',False)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
         adv_param = QgsProcessingParameterString(self.T_DBM,'Threshold signal strength in dBm (i.e. -65)','-65')
         adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(adv_param)
@@ -90,6 +3483,90 @@ class BestSignalProcessingAlgorithm(QgsProcessingAlgorithm):
         adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(adv_param)
 
+        adv_param = QgsProcessingParameterNumber(self.CONCURRENCY,'Number of concurrent CloudRF requests',QgsProcessingParameterNumber.Integer,4,False,1,64)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.RATE_LIMIT,'Maximum CloudRF requests per second (0 for no limit)',QgsProcessingParameterNumber.Double,4,False,0)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.MAX_RETRIES,'Retries per throttled or failed request',QgsProcessingParameterNumber.Integer,5,False,0,20)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.RETRY_BUDGET,'Total retries allowed for the whole run',QgsProcessingParameterNumber.Integer,500,False,0)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.TIMEOUT,'Timeout in seconds to wait for each CloudRF response',QgsProcessingParameterNumber.Double,120,False,1)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterBoolean(self.GZIP,'Request gzip compressed responses from CloudRF',True)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterFile(self.CACHE_FOLDER,'Folder of cached CloudRF responses',QgsProcessingParameterFile.Folder,optional=True)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.CACHE_TTL,'Days before a cached response expires (0 to never expire)',QgsProcessingParameterNumber.Double,30,False,0)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.CACHE_SIZE,'Maximum size of the response cache in MB',QgsProcessingParameterNumber.Double,1024,False,1)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterBoolean(self.CLEAR_CACHE,'Clear cached responses of this network before requesting',False)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterBoolean(self.DEDUPLICATE,'Request civics sharing a grid cell only once',False)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.SNAP_CELLS,'Grid cell size for grouping civics, in multiples of the raster resolution',QgsProcessingParameterNumber.Double,1,False,0.1)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterBoolean(self.INCREMENTAL,'Only request and parse civics added or changed since the previous run',False)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.PARSE_WORKERS,'Number of worker processes parsing responses (1 parses in the QGIS process)',QgsProcessingParameterNumber.Integer,1,False,1,64)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterBoolean(self.PREFETCH_CHARTS,'Download the chart images to a local cache and point the map tips at the local copies',False)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.CHART_CACHE_SIZE,'Maximum size of the chart image cache in MB',QgsProcessingParameterNumber.Double,512,False,1)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterEnum(self.PRESCREEN,'Estimate clearly good or bad civics locally with a path loss model fitted on previous runs',['Off','Empirical model','Free space model'],False,0)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.PRESCREEN_MARGIN,'Margin in dB between an estimate and the threshold or marginal band',QgsProcessingParameterNumber.Double,10,False,0)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterNumber(self.CHUNK_SIZE,'Process and write civics in chunks of this many to bound memory use (0 keeps every civic in memory)',QgsProcessingParameterNumber.Integer,0,False,0)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterString(self.SWEEP_THRESHOLDS,'Other thresholds in dBm to compare with the threshold, separated by commas (i.e. -75, -85)','',False,True)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
+        adv_param = QgsProcessingParameterBoolean(self.SWEEP_LAYERS,'Add a civics layer styled at each of the other thresholds',False)
+        adv_param.setFlags(adv_param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(adv_param)
+
         # We add a feature sink in which to store our processed features (this
         # usually takes the form of a newly created vector layer when the
         # algorithm is run in QGIS).
@@ -102,6 +3579,21 @@ class BestSignalProcessingAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterFeatureSink(self.OUTPUT_SPOKES, 'Spokes from each civic to best tower location', type=QgsProcessing.TypeVectorAnyGeometry, defaultValue="")
         )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.OUTPUT_SERVERS, 'Table of civics and their best servers, one row per civic and server', type=QgsProcessing.TypeVector, optional=True, createByDefault=False)
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(self.OUTPUT_METRICS, 'Run metrics', 'JSON files (*.json);;Prometheus text files (*.prom)', optional=True, createByDefault=False)
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(self.OUTPUT_PACKAGE, 'GeoPackage of the styled civics, towers and spokes', 'GeoPackage files (*.gpkg)', optional=True, createByDefault=False)
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.OUTPUT_SWEEP, 'Comparison of the thresholds', type=QgsProcessing.TypeVector, optional=True, createByDefault=False)
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.OUTPUT_SWEEP_TOWERS, 'Tower connection statistics at each of the compared thresholds', type=QgsProcessing.TypeVectorPoint, optional=True, createByDefault=False)
+        )
 
     def processAlgorithm(self, parameters, context, model_feedback):
 
@@ -112,21 +3604,47 @@ class BestSignalProcessingAlgorithm(QgsProcessingAlgorithm):
         key = self.parameterAsString(parameters,self.KEY,context)
         rxh = self.parameterAsString(parameters,self.RXH,context)
         rxg = self.parameterAsString(parameters,self.RXG,context)
-        ant = self.parameterAsString(parameters,self.ANT,context)
         res = self.parameterAsString(parameters,self.RES,context)
+        concurrency = self.parameterAsInt(parameters,self.CONCURRENCY,context)
+        rate_limit = self.parameterAsDouble(parameters,self.RATE_LIMIT,context)
+        max_retries = self.parameterAsInt(parameters,self.MAX_RETRIES,context)
+        retry_budget = self.parameterAsInt(parameters,self.RETRY_BUDGET,context)
+        timeout = self.parameterAsDouble(parameters,self.TIMEOUT,context)
+        gzip = self.parameterAsBool(parameters,self.GZIP,context)
+        cache_folder = self.parameterAsFile(parameters,self.CACHE_FOLDER,context)
+        cache_ttl = self.parameterAsDouble(parameters,self.CACHE_TTL,context)
+        cache_size = self.parameterAsDouble(parameters,self.CACHE_SIZE,context)
+        clear_cache = self.parameterAsBool(parameters,self.CLEAR_CACHE,context)
+        deduplicate = self.parameterAsBool(parameters,self.DEDUPLICATE,context)
+        snap_cells = self.parameterAsDouble(parameters,self.SNAP_CELLS,context)
+        incremental = self.parameterAsBool(parameters,self.INCREMENTAL,context)
+        parse_workers = self.parameterAsInt(parameters,self.PARSE_WORKERS,context)
+        chunk_size = self.parameterAsInt(parameters,self.CHUNK_SIZE,context)
+        prefetch_charts = self.parameterAsBool(parameters,self.PREFETCH_CHARTS,context)
+        chart_cache_size = self.parameterAsDouble(parameters,self.CHART_CACHE_SIZE,context)
+        prescreen = [None, 'empirical', 'free_space'][self.parameterAsEnum(parameters,self.PRESCREEN,context)]
+        prescreen_margin = self.parameterAsDouble(parameters,self.PRESCREEN_MARGIN,context)
+        top_n = self.parameterAsInt(parameters,self.TOP_N,context)
+        spokes_all_servers = self.parameterAsBool(parameters,self.SPOKES_ALL_SERVERS,context)
+        geodesic = self.parameterAsBool(parameters,self.GEODESIC,context)
+        metrics_path = self.parameterAsFileOutput(parameters,self.OUTPUT_METRICS,context)
+        package_path = self.parameterAsFileOutput(parameters,self.OUTPUT_PACKAGE,context)
+        sweep_thresholds = [float(value) for value in re.split('[,; ]+', self.parameterAsString(parameters,self.SWEEP_THRESHOLDS,context).strip()) if value]
+        sweep_layers = self.parameterAsBool(parameters,self.SWEEP_LAYERS,context)
 
-        outputs = {}
         results = {}
 
         try:
             # Compute the number of steps to display within the progress bar and
             # get features from source
             total_source_features = source_civic.featureCount()
-            total_steps = 9 + total_source_features + (total_source_features//10)
+            # One step per civic and seven for the preparation, tower, civic and
+            # styling phases
+            total_steps = 7 + total_source_features
+            metrics = PipelineMetrics()
             current_step = 0
             feedback = QgsProcessingMultiStepFeedback(total_steps, model_feedback)
 
-            source_path = self.parameterDefinition(self.INPUT_CIVICS).valueAsPythonString(parameters[self.INPUT_CIVICS], context).strip("'")
             out_civic_path = self.parameterDefinition(self.OUTPUT_CIVICS).valueAsPythonString(parameters[self.OUTPUT_CIVICS], context).strip("'")
             out_tower_path = self.parameterDefinition(self.OUTPUT_TOWERS).valueAsPythonString(parameters[self.OUTPUT_TOWERS], context).strip("'")
             out_spoke_path = self.parameterDefinition(self.OUTPUT_SPOKES).valueAsPythonString(parameters[self.OUTPUT_SPOKES], context).strip("'")
@@ -144,460 +3662,189 @@ class BestSignalProcessingAlgorithm(QgsProcessingAlgorithm):
             if not os.path.exists(data_folder):
             		os.makedirs(data_folder)
 
+            metrics.lap('prepare')
             current_step += 1
             feedback.setCurrentStep(current_step)
             if feedback.isCanceled():
                 return {}
-            time.sleep(.25)
 
             # check if the name of output layer exsist in the current project if so remove it
             project = QgsProject.instance()
-            output_files = [out_civic_path,out_tower_path,out_spoke_path]
             layer_list = [civic_basename,tower_basename,spoke_basename]
             if project.mapLayersByName(civic_basename) or project.mapLayersByName(tower_basename) or project.mapLayersByName(spoke_basename):
                 for index in range(len(layer_list)):
                     if project.mapLayersByName(layer_list[index]):
                         feedback.pushInfo('Removing {} layer from project to prevent file lock...'.format(layer_list[index]))
                         project.removeMapLayer(project.mapLayersByName(layer_list[index])[0].id())
-                # wait time for remove to finish or else file will be locked
-                time.sleep(1)
 
+            metrics.lap('prepare')
             current_step += 1
             feedback.setCurrentStep(current_step)
             if feedback.isCanceled():
                 return {}
-            time.sleep(.25)
-
-            # Reproject input civics layer to WGS84 for lat lon coordinates
-            feedback.pushInfo('Reprojecting input layer to CRS:WGS84...')
-            alg_params = {
-                'INPUT' : parameters[self.INPUT_CIVICS],
-                'TARGET_CRS' : 'EPSG:4326',
-                'OUTPUT' : QgsProcessing.TEMPORARY_OUTPUT
-            }
 
-            outputs['Reproject'] = processing.run('native:reprojectlayer', alg_params, context=context, feedback=feedback,is_child_algorithm=False)
+            # Civic coordinates are reprojected to WGS84 in bulk as they are read
+            # from the input layer, rather than through a reprojected copy of it
+            transform = WGS84Transform(source_civic.sourceCrs(), context.transformContext(), metrics)
+            if transform.identity:
+                feedback.pushInfo('Input layer is in CRS:WGS84...')
+            else:
+                feedback.pushInfo('Reprojecting input layer from {} to CRS:WGS84 with {}...'.format(source_civic.sourceCrs().authid(), 'pyproj' if transform.transformer is not None else 'QGIS'))
 
+            metrics.lap('prepare')
             current_step += 1
             feedback.setCurrentStep(current_step)
             if feedback.isCanceled():
                 return {}
-            time.sleep(.25)
-
-            # Iterate through the reprojected civics to write a CSV to be passed to
-            # CloudRF best server API requests
-            feedback.pushInfo('Generating CSV for CloudRF Best Server API request...')
-            features = outputs['Reproject']['OUTPUT'].getFeatures()
-            csv_path = '{}{}{}_civics.csv'.format(data_folder,os.sep,civic_basename)
-
-            list_of_fields = outputs['Reproject']['OUTPUT'].fields().names()
-
-            with open(csv_path,'w') as output_csv:
-                line = 'civic,uid,key,rxh,rxg,net,lat,lon\n'
-                output_csv.write(line)
-                for feat in features:
-                    if isinstance(feat[parameters[self.CIVIC_FIELD]], str):
-                        civic_ID = feat[parameters[self.CIVIC_FIELD]].replace('(','').replace(')','').replace('"','')
-                    else:
-                        civic_ID = feat[parameters[self.CIVIC_FIELD]]
-                    if feat.geometry().isMultipart():
-                        ptWGS = feat.geometry().asMultiPoint()[0]
-                    else:
-                        ptWGS = feat.geometry().asPoint()
-                    line = '{},{},{},{},{},{},{},{}'.format(civic_ID,uid,key,rxh,rxg,network, ptWGS.y(),ptWGS.x())
-                    line += '\n'
-                    output_csv.write(line)
 
-            current_step += 1
-            feedback.setCurrentStep(current_step)
-            if feedback.isCanceled():
-                return {}
-            time.sleep(.25)
+            # The CloudRF requests, parsing and aggregation are run by the same
+            # pipeline as the command line, the algorithm only reads the civics
+            # from the input layer and writes and styles the output layers
+            if not cache_folder:
+                cache_folder = '{}{}cloudrf_cache'.format(directory,os.sep)
 
-            # Creating subfolder to store all JSON data for each civic API request
-            csvfile = csv.DictReader(open(csv_path))
-            interestedrow = [row for idx, row in enumerate(csvfile) if idx >= 0]
-            network_name = interestedrow[0]['net']
-            feedback.pushInfo('Creating {} folder to store civic JSON files...'.format(network_name))
-            best_path = "{}{}{}_best_signal".format(data_folder,os.sep,network_name)
-            if not os.path.exists(best_path):
-            		os.makedirs(best_path)
+            # Civics sharing a grid cell tied to the raster resolution get the same
+            # answer from CloudRF, so optionally only one request is made per cell
+            snap_m = float(res)*snap_cells if deduplicate else None
 
+            civic_field = parameters[self.CIVIC_FIELD]
+
+            metrics.lap('prepare')
             current_step += 1
             feedback.setCurrentStep(current_step)
             if feedback.isCanceled():
                 return {}
-            time.sleep(.25)
 
-            # Iterating through the civic CSV to make CloudRF best server request
-            opened_csv = open(csv_path)
-            try:
-                csvfile = csv.DictReader(opened_csv)
-                n = 0
-                for row in csvfile:
-                    n += 1
-                    global server
-                    json_path = best_path+os.sep+row.get('civic')+'.json'
-                    try:
-                        if os.path.exists(json_path) and os.stat(json_path).st_size > 500:
-                            feedback.pushInfo('JSON file exists for Property ID: {} ({}/{})'.format(row['civic'],n,total_source_features))
-                        else:
-                            feedback.pushInfo('Requesting best signal for Property ID: {} ({}/{})'.format(row['civic'],n,total_source_features))
-                            filename = open(json_path,"wb")
-                            req = requests.post(server+"/API/network/index.php", data=row,verify=strictSSL)
-                            time.sleep(.25)
-                            filename.write(req.content)
-                            filename.close()
-
-                        current_step += 1
-                        feedback.setCurrentStep(current_step)
-                        if feedback.isCanceled():
-                            return {}
-                        # feedback.pushInfo(req.content)
-                    except Exception:
-                        tb = sys.exc_info()[2]
-                        tbinfo = traceback.format_tb(tb)[0]
-                        # information concerning the error
-                        pymsg = "PYTHON ERRORS:\nTraceback info:\n{}\nError Info:\n{}".format(tbinfo, str(sys.exc_info()[1]))
-                        # AddMessage Python error messages for use in QGIS
-                        feedback.pushInfo('{}'.format(pymsg))
-                        continue
-            finally:
-                opened_csv.close()
-
-            # Generating CSV file of unique towers and civics with signal strength
-            # from the 5 best nearby towers
-            os.chdir(best_path)
-            unique_towers = {}
-
-            unique_tower_csv = data_folder+os.sep+network_name+'_towers.csv'
-            unique_tower_csvt = data_folder+os.sep+network_name+'_towers.csvt'
-            net_str_csv = data_folder+os.sep+network_name+'_civics_signal_strength.csv'
-            net_str_csv_format = data_folder+os.sep+network_name+'_civics_signal_strength.csvt'
-
-            # Create a .csvt file to allow QGIS to associate field types with coresponding
-            # csv file to enable joining with (shape)files with matching field types
-            feedback.pushInfo('Creating a CSV of civics with the best associated signal strength...')
-            civic_field_type = source_civic.fields().field(parameters[self.CIVIC_FIELD]).typeName()
-            with open(net_str_csv_format,'w') as format_csv:
-                line = '"{}","Real","Real","Real","String","Real","String","String","Real","Real","Real","String","Real","String","String","Real","Real","Real"'.format(civic_field_type)
-                format_csv.write(line)
-            with open(unique_tower_csvt,'w') as format_csv:
-                line = '"String","Real","Real","Real","Integer","Real","Integer","Real","Integer","Real","Integer"'
-                format_csv.write(line)
-
-            # Truncates the first 4 characters of the network name to use as prefixes for attribute field names
-            if len(network.split('_')[0])>5:
-                net_prefix = network.split('_')[0][0:4]
-            else:
-                net_prefix = network.split('_')[0]
-
-            file_count = len(glob.glob('*.json'))
-
-            with open(net_str_csv,'w') as network_file:
-                line = 'civic,civic_lat,civic_lon,target,{0}_T1,{0}_S1,{0}S1_QoC,{0}S1_url,{0}s1_dis,{0}S1_azi,{0}S1_tlt,{0}_T2,{0}_S2,{0}S2_QoC,{0}S2_url,{0}S2_dis,{0}S2_azi,{0}S2_tlt\n'.format(net_prefix)
-                network_file.write(line)
-                # Iterates through the current directory for .json files and parse the data
-                # to a CSV file to be joined to the exisiting civic layer
-                h_interval = 0
-                interval = 0
-                count = 0
-                for file in glob.glob('*.json'):
-                    civic = os.path.splitext(file)[0]
-                    count += 1
-                    with open(file) as json_file:
-                        try:
-                            data = json.load(json_file)
-                            try:
-                                dict = {}
-                                for field in data:
-                                    data_list = []
-                                    tower_field = field.get('Server name')
-                                    tower_name = tower_field.split('{}_'.format(network))[1].replace('_',' ').strip()
-                                    signal_str = field['Transmitters'][0]['Signal power at receiver dBm']
-                                    data_list.append(signal_str)
-
-                                    if signal_str >= float(t_dbm):
-                                        connection_quality = 'Good'
-                                    elif signal_str >= float(t_dbm)-10:
-                                        connection_quality = 'Marginal'
-                                    else:
-                                        connection_quality = 'Bad'
-                                    data_list.append(connection_quality)
-
-                                    url = field['Chart image']
-                                    rlat = field['Receiver'][0]['Latitude']
-                                    rlon = field['Receiver'][0]['Longitude']
-                                    dis = field['Transmitters'][0]['Distance to receiver km']
-                                    azi = field['Transmitters'][0]['Azimuth to receiver deg']
-                                    tilt = field['Transmitters'][0]['Downtilt angle deg']
-
-                                    if azi <= 180:
-                                        azi = azi + 180
-                                        print(azi)
-                                    else:
-                                        azi = azi - 180
-                                        print(azi)
-
-                                    tilt = -tilt
-
-                                    data_list.append(url)
-                                    data_list.append(dis)
-                                    data_list.append(azi)
-                                    data_list.append(tilt)
-
-                                    # Adds tower coordinates to dictionary of towers if not already in
-                                    if tower_name not in unique_towers:
-                                        lat = field['Transmitters'][0]['Latitude']
-                                        long = field['Transmitters'][0]['Longitude']
-                                        height = field['Transmitters'][0]['Antenna height m']
-                                        coordinate = [long,lat,height]
-                                        unique_towers[tower_name] = coordinate
-                                    dict[tower_name] = data_list
-                                # Sorts dictionary of towers from best to weakest signal
-                                sorted_dict = sorted(dict.items(),key=lambda item:item[1][0],reverse=True)[:2]
-                                line = '{},{},{},{}'.format(civic,rlat,rlon,t_dbm)
-                                for i in sorted_dict:
-                                    line += ',{},{},{},{},{},{},{}'.format(i[0],i[1][0],i[1][1],i[1][2],i[1][3],i[1][4],i[1][5])
-                                line += '\n'
-                                network_file.write(line)
-                            except Exception:
-                                tb = sys.exc_info()[2]
-                                tbinfo = traceback.format_tb(tb)[0]
-                                # information concerning the error
-                                pymsg = "PYTHON ERRORS:\nTraceback info:\n{}\nError Info:\n{}".format(tbinfo, str(sys.exc_info()[1]))
-                                # AddMessage Python error messages for use in QGIS
-                                feedback.pushInfo('{}'.format(pymsg))
-                                error = data.get('error')
-                                line = '{},{},-999\n'.format(civic,error)
-                                network_file.write(line)
-                                continue
-                        except Exception:
-                            tb = sys.exc_info()[2]
-                            tbinfo = traceback.format_tb(tb)[0]
-                            # information concerning the error
-                            pymsg = "PYTHON ERRORS:\nTraceback info:\n{}\nError Info:\n Civic JSON file: {}.json\n{}".format(tbinfo,civic,str(sys.exc_info()[1]))
-                            # AddMessage Python error messages for use in QGIS
-                            feedback.pushInfo('{}'.format(pymsg))
-
-                    if h_interval != count//10:
-                        h_interval += 1
-                        if file_count < 20:
-                            feedback.pushInfo('Parsing json data...')
-                            current_step += 1
-                            feedback.setCurrentStep(current_step)
-                            if feedback.isCanceled():
-                                return {}
-                        else:
-                            five_percent = count//(file_count//20)
-                            if interval != five_percent:
-                                interval = five_percent
-                                feedback.pushInfo('Parsing json data at {}%...'.format(interval*5))
-                            current_step += 1
-                            feedback.setCurrentStep(current_step)
-                            if feedback.isCanceled():
-                                return {}
-
-
-            # Iterate through network file to calculate coverage statistics
-            stat_file = csv.DictReader(open(net_str_csv))
-            total_good_signals = 0
-            total_marginal_signals = 0
-            total_bad_signals = 0
-            total_connections = 0
-            for row in stat_file:
-                good_signals = 0
-                marginal_signals = 0
-                bad_signals = 0
-                total_connections += 1
-                tower_name = row.get('{}_T1'.format(net_prefix))
-                sig_str = float(row.get('{}_S1'.format(net_prefix)))
-                if sig_str >= float(t_dbm):
-                    total_good_signals += 1
-                    good_signals += 1
-                elif sig_str >= float(t_dbm)-10:
-                    total_marginal_signals += 1
-                    marginal_signals += 1
-                else:
-                    total_bad_signals += 1
-                    bad_signals += 1
-
-                tower_att = unique_towers[tower_name]
-                if len(tower_att) == 3:
-                    tower_att.extend([good_signals, round(good_signals/1,4), marginal_signals, round(marginal_signals/1,4), bad_signals, round(bad_signals/1,4), 1])
-                else:
-                    tower_att[9] += 1
-                    tower_att[3] += good_signals
-                    tower_att[4] = round(tower_att[3]/tower_att[9],4)
-                    tower_att[5] += marginal_signals
-                    tower_att[6] = round(tower_att[5]/tower_att[9],4)
-                    tower_att[7] += bad_signals
-                    tower_att[8] = round(tower_att[7]/tower_att[9],4)
-
-            # Generates a CSV list of unique towers with assiciated coordinates
-            feedback.pushInfo('Creating a CSV of all unique towers...')
-            with open(unique_tower_csv,'w') as unique_tower_file:
-                line = 'Tower,X,Y,Z,Good_Con,Good_Pct,Margin_Con,Margin_Pct,Bad_Con,Bad_Pct,Total_Con\n'
-                unique_tower_file.write(line)
-                for item in unique_towers:
-                    if len(unique_towers[item]) == 3:
-                        line = '{},{},{},{}\n'.format(item.replace('_',' '), *unique_towers[item])
-                    else:
-                        line = '{},{},{},{},{},{},{},{},{},{},{}\n'.format(item.replace('_',' '), *unique_towers[item])
-                    unique_tower_file.write(line)
-
-            # Join the returned civic signal strength CSV to civic shapefile layer
+            # In chunks only the fixed size tower aggregates are kept in memory,
+            # the civic results are read back from the checkpoint store a chunk
+            # at a time as the output layers are written
+            towers = TowerAggregates()
+
+            def add_chunk(chunk_results):
+                towers.add(chunk_results, classify_signals(chunk_results.column('signal'), t_dbm))
+
+            fingerprints = {}
+            civic_rows = iter_point_rows(feature_points(source_civic.getFeatures(), civic_field, transform), uid, key, rxh, rxg, network, fingerprints)
+            steps_done = current_step
+            signal_results = best_signal_analysis(civic_rows, fingerprints, network, res, data_folder, server, strictSSL, top_n,
+                                                  concurrency, rate_limit, max_retries, retry_budget, timeout, gzip,
+                                                  cache_folder, cache_ttl, cache_size, clear_cache, snap_m, incremental, parse_workers,
+                                                  feedback, total_source_features, lambda n: feedback.setCurrentStep(steps_done+n), metrics=metrics,
+                                                  chunk_size=chunk_size or None, on_chunk=add_chunk if chunk_size else None,
+                                                  t_dbm=t_dbm, prescreen=prescreen, prescreen_margin=prescreen_margin)
+            if signal_results is None:
+                return {}
+            current_step += total_source_features
+            metrics.lap()
+
+            # Chart images are downloaded up front, or a chunk at a time while
+            # writing in chunks, so the map tips show local copies
+            charts = None
+            if prefetch_charts:
+                charts = ChartCache('{}{}cloudrf_charts'.format(directory,os.sep), chart_cache_size, concurrency, rate_limit, timeout, strictSSL)
+            summary = summarize_results(signal_results, data_folder, network, top_n, t_dbm, towers if chunk_size else None, charts, feedback, metrics)
+            metrics.lap('aggregate')
+
+            # The civics, towers, spokes and optional server table are written
+            # into the output sinks by the same function as the command line.
+            # Civics keep their geometry, single points are rebuilt from the
+            # bulk reprojected coordinates and other geometries are transformed
+            # one by one
+            feedback.pushInfo('Creating tower {} shapefile...'.format(tower_basename))
             feedback.pushInfo('Creating civic signal strength {} shapefile...'.format(civic_basename))
-            alg_params = {
-                # 'INPUT' : parameters[self.INPUT_CIVICS],
-                'INPUT' : outputs['Reproject']['OUTPUT'],
-                'FIELD' : parameters[self.CIVIC_FIELD],
-                'INPUT_2' : net_str_csv,
-                'FIELD_2' : 'civic',
-                'OUTPUT' : parameters[self.OUTPUT_CIVICS]
-            }
-            outputs['JoinCivicFields'] = processing.run('qgis:joinattributestable', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
-            results[self.OUTPUT_CIVICS] = outputs['JoinCivicFields']['OUTPUT']
+            feedback.pushInfo('Creating civic signal strenth spokes {} shapefile...'.format(spoke_basename))
+            single_points = source_civic.wkbType() == QgsWkbTypes.Point
+
+            def civic_points():
+                for features in chunked(source_civic.getFeatures(), chunk_size or 1000):
+                    for (civic, lon, lat, values), feat in zip(feature_points(features, civic_field, transform), features):
+                        if transform.identity:
+                            geometry = feat.geometry()
+                        elif single_points:
+                            geometry = ('Point', (lon, lat))
+                        else:
+                            geometry = transform.geometry(feat.geometry())
+                        yield civic, lon, lat, values, geometry
 
-            current_step += 1
-            feedback.setCurrentStep(current_step)
+            sinks = SinkLayers(self, parameters, context, {'civics': self.OUTPUT_CIVICS, 'towers': self.OUTPUT_TOWERS, 'spokes': self.OUTPUT_SPOKES,
+                                                           'servers': self.OUTPUT_SERVERS}, source_civic)
+            try:
+                write_outputs(civic_points(), source_civic.fields().names(), civic_field, network, summary, directory, spoke_basename,
+                              spokes_all_servers=spokes_all_servers, geodesic=geodesic, server_table=True, chunk_size=chunk_size or 1000,
+                              outputs=sinks, feedback=feedback)
+            finally:
+                if chunk_size:
+                    summary.close()
+                if charts is not None:
+                    charts.close()
             if feedback.isCanceled():
                 return {}
-            time.sleep(.25)
+            if charts is not None:
+                feedback.pushInfo('Chart images: {} downloaded, {} failed'.format(charts.downloaded, charts.failed))
+            results.update(sinks.results)
+            create_spatial_indexes([sinks.paths[output] for output in ('civics', 'towers', 'spokes')], context)
 
-            # Convert Tower table to a Point Layer
-            feedback.pushInfo('Creating tower {} shapefile...'.format(tower_basename))
-            alg_params = {
-                'INPUT' : unique_tower_csv,
-                'XFIELD' : 'X',
-                'YFIELD' : 'Y',
-                'ZFIELD' : 'Z',
-                'TARGET_CRS' : QgsCoordinateReferenceSystem('EPSG:4326'),
-                'OUTPUT' : parameters[self.OUTPUT_TOWERS]
-            }
-            outputs['TowerTableToPoints'] = processing.run('qgis:createpointslayerfromtable', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
-            results[self.OUTPUT_TOWERS] = outputs['TowerTableToPoints']['OUTPUT']
-
-            current_step += 1
+            metrics.lap('write')
+            current_step += 2
             feedback.setCurrentStep(current_step)
             if feedback.isCanceled():
                 return {}
-            time.sleep(.25)
 
-            # Generate Hublines from Civics and Towers
-            feedback.pushInfo('Creating civic signal strenth spokes {} shapefile...'.format(spoke_basename))
-            alg_params = {
-                'HUBS': outputs['TowerTableToPoints']['OUTPUT'],
-                'HUB_FIELD': 'Tower',
-                'SPOKES': outputs['JoinCivicFields']['OUTPUT'],
-                'SPOKE_FIELD': '{}_T1'.format(net_prefix),
-                'GEODESIC': False,
-                'GEODESIC_DISTANCE': 1000,
-                'ANTIMERIDIAN_SPLIT': False,
-                'OUTPUT': parameters[self.OUTPUT_SPOKES]
-            }
-            outputs['CivicTowerSpokes'] = processing.run('qgis:hublines', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
-            results[self.OUTPUT_SPOKES] = outputs['CivicTowerSpokes']['OUTPUT']
+            # Styles the layers to meet the threshold of signal strength and
+            # saves the styles for auto styling upon being loaded
+            layers = {output: QgsProcessingUtils.mapLayerFromString(dest_id, context) for output, dest_id in sinks.paths.items()}
+            good, marginal, bad = summary.towers.totals()
+            style_outputs(layers['civics'], layers['towers'], layers['spokes'], network, threshold_ranges(t_dbm, good, marginal, bad, total_source_features))
+            for output, path in (('spokes', out_spoke_path), ('civics', out_civic_path), ('towers', out_tower_path)):
+                layers[output].saveNamedStyle(path.rsplit('.',1)[0] + '.qml')
+            metrics.lap('styling')
+
+            # All of the layers and their styles in a single GeoPackage, whose
+            # layers GDAL writes with R-tree spatial indexes
+            if package_path:
+                processing.run('native:package', {'LAYERS': list(layers.values()), 'OUTPUT': package_path, 'OVERWRITE': True, 'SAVE_STYLES': True},
+                               context=context, feedback=feedback, is_child_algorithm=True)
+                results[self.OUTPUT_PACKAGE] = package_path
+                metrics.lap('package')
+
+            # What-if comparison of the threshold with the other thresholds over
+            # the results stored by this run, without requesting or parsing them
+            # again
+            if sweep_thresholds:
+                sweep = ThresholdSweep([float(t_dbm)]+sweep_thresholds)
+                checkpoint = CheckpointStore(checkpoint_path(data_folder, network), top_n)
+                try:
+                    sweep.add_checkpoint(checkpoint, network)
+                finally:
+                    checkpoint.close()
+                sweep_rows = sweep.rows()
+                for threshold, good, good_pct, marginal, marginal_pct, bad, bad_pct, total, good_towers in sweep_rows:
+                    feedback.pushInfo('At {:g} dBm: {} good, {} marginal and {} bad connections, {} towers with good connections'.format(
+                        threshold, good or 0, marginal or 0, bad or 0, good_towers))
+                sweep_sinks = SinkLayers(self, parameters, context, {'thresholds': self.OUTPUT_SWEEP, 'towers': self.OUTPUT_SWEEP_TOWERS})
+                write_sweep(sweep, directory, spoke_basename, outputs=sweep_sinks)
+                results.update(sweep_sinks.results)
+
+                # A copy of the civics layer classified at each of the other
+                # thresholds, with its style saved next to the output civics
+                if sweep_layers:
+                    for threshold, good, good_pct, marginal, marginal_pct, bad, bad_pct, total, good_towers in sweep_rows[1:]:
+                        sweep_layer = sweep_civics_layer(layers['civics'], network, threshold,
+                                                         threshold_ranges('{:g}'.format(threshold), good or 0, marginal or 0, bad or 0, total_source_features))
+                        sweep_layer.saveNamedStyle(out_civic_path.rsplit('.',1)[0] + '_{:g}dBm.qml'.format(threshold))
+                        context.temporaryLayerStore().addMapLayer(sweep_layer)
+                        context.addLayerToLoadOnCompletion(sweep_layer.id(), QgsProcessingContext.LayerDetails(sweep_layer.name(), context.project(), sweep_layer.name()))
+                metrics.lap('sweep')
 
             current_step += 1
             feedback.setCurrentStep(current_step)
-            if feedback.isCanceled():
-                return {}
-            time.sleep(.25)
-
-            # Defining field name for column to be analyzed and color ranges for signal strenth thresholds
-            myColumn = '{}_S1'.format(net_prefix)
-            ranges = []
-
-            myMin1 = float(t_dbm)
-            myMax1 = 0
-            myLabel1 = 'Signals stronger than {} dBm ({}/{}) {}%'.format(t_dbm, total_good_signals, total_source_features, round((total_good_signals/total_source_features)*100,2))
-            myColor1 = QtGui.QColor('#0772f5')
-            ranges.append((myMin1, myMax1, myLabel1, myColor1))
-
-            myMin2 = float(t_dbm)-10
-            myMax2 = float(t_dbm)-0.001
-            myLabel2 = 'Marginal signals between {} to {} dBm ({}/{}) {}%'.format(myMax2, myMin2, total_marginal_signals, total_source_features, round((total_marginal_signals/total_source_features)*100,2))
-            myColor2 = QtGui.QColor('#7e7e7e')
-            ranges.append((myMin2, myMax2, myLabel2, myColor2))
-
-            myMin3 = -1000
-            myMax3 = float(t_dbm)-10.000000000000001
-            myLabel3 = 'Signals weaker than {} dBm ({}/{}) {}%'.format(myMax3,total_bad_signals,total_source_features,round((total_bad_signals/total_source_features)*100,2))
-            myColor3 = QtGui.QColor('#f58a07')
-            ranges.append((myMin3, myMax3, myLabel3, myColor3))
-
-            # Style Spokes layer to meet threshold of signal strength
-            spokes_layer = QgsProcessingUtils.mapLayerFromString(outputs['CivicTowerSpokes']['OUTPUT'], context)
-            myRangeList = []
-
-            for myMin, myMax, myLabel, myColor in ranges:
-              mySymbol = QgsSymbol.defaultSymbol(spokes_layer.geometryType())
-              mySymbol.setColor(myColor)
-              mySymbol.setWidth(.5)
-              myRange = QgsRendererRange(myMin, myMax, mySymbol, myLabel)
-              myRangeList.append(myRange)
-
-            myRenderer = QgsGraduatedSymbolRenderer('', myRangeList)
-            myRenderer.setClassAttribute(myColumn)
-            spokes_layer.setRenderer(myRenderer)
-            spokes_layer.triggerRepaint()
-
-            # Create map tip to display Path Profile chart from cloudRF
-            expression = """<img src = "[% "{}S1_url" %]" width="600" />""".format(net_prefix)
-            spokes_layer.setMapTipTemplate(expression)
-
-            # Style Civics layer to meet threshold of signal strength
-            civics_layer = QgsProcessingUtils.mapLayerFromString(outputs['JoinCivicFields']['OUTPUT'], context)
-
-            myRangeList = []
-
-            for myMin, myMax, myLabel, myColor in ranges:
-              mySymbol = QgsSymbol.defaultSymbol(civics_layer.geometryType())
-              mySymbol.setColor(myColor)
-              myRange = QgsRendererRange(myMin, myMax, mySymbol, myLabel)
-              myRangeList.append(myRange)
-
-            myRenderer = QgsGraduatedSymbolRenderer('', myRangeList)
-            myRenderer.setClassAttribute(myColumn)
-            civics_layer.setRenderer(myRenderer)
-            civics_layer.triggerRepaint()
-
-            # Create map tip to display Path Profile chart from cloudRF
-            civics_layer.setMapTipTemplate(expression)
-
-            # Setting labels for Wireless Towers
-            towers_layer = QgsProcessingUtils.mapLayerFromString(outputs['TowerTableToPoints']['OUTPUT'], context)
-
-            layer_settings  = QgsPalLayerSettings()
-            layer_settings.fieldName = "Tower"
-            layer_settings.enabled = True
-            layer_settings = QgsVectorLayerSimpleLabeling(layer_settings)
-
-            buffer_settings = QgsTextBufferSettings()
-            buffer_settings.setEnabled(True)
-            buffer_settings.setSize(1)
-            buffer_settings.setColor(QtGui.QColor('white'))
-
-            tower_symbol = QgsSvgMarkerSymbolLayer('https://upload.wikimedia.org/wikipedia/commons/d/db/Octicons-radio-tower.svg')
-            towers_layer.renderer().symbol().changeSymbolLayer(0, tower_symbol)
-            towers_layer.renderer().symbol().setSize(6)
-            towers_layer.setLabelsEnabled(True)
-            towers_layer.setLabeling(layer_settings)
-            towers_layer.triggerRepaint()
-
-            # Save layer styles for auto styling upon being loaded
-            spokes_style = out_spoke_path.rsplit('.',1)[0] + '.qml'
-            spokes_layer.saveNamedStyle(spokes_style)
-            civics_style = out_civic_path.rsplit('.',1)[0] + '.qml'
-            civics_layer.saveNamedStyle(civics_style)
-            towers_style = out_tower_path.rsplit('.',1)[0] + '.qml'
-            towers_layer.saveNamedStyle(towers_style)
-
-            if os.path.exists(best_path) and os.path.isdir(best_path):
-                feedback.pushInfo('Deleting interim data folder: {}'.format(best_path))
-                os.chdir(directory)
-                #shutil.rmtree(best_path)
+
+            # Timings and counters of the run for sizing concurrency and quotas
+            snapshot = metrics.snapshot()
+            feedback.pushInfo('Phase timings: {}'.format(', '.join('{} {:.1f}s'.format(name, seconds) for name, seconds in snapshot['phases_s'].items())))
+            if metrics_path:
+                metrics.report(metrics_path)
+                results[self.OUTPUT_METRICS] = metrics_path
 
             return results
 
@@ -643,6 +3890,8 @@ class BestSignalProcessingAlgorithm(QgsProcessingAlgorithm):
     def shortHelpString(self):
         return self.tr("This algorithm calculates the best tower for optimal signal strength for each of the features in an input layer and generates a hub and spokes diagram by showcasing the signal strength of a tower connection to civic based from the identified existing Tower network on CloudRF.\n\
         Determination of which tower connects to each civic is based on the best signal strength (calculated by CloudRF) that civic can receive from the 5 closest towers.\n\
+        Spokes: A spoke line is drawn from each civic to its best tower, or to each of its best towers, optionally as a geodesic line. Spokes are styled on the signal of the tower they connect to.\n\
+        Number of best servers: How many of the towers returned by CloudRF are kept for each civic, from the strongest signal to the weakest. Each server adds a tower, signal, quality, chart, distance, azimuth and downtilt field to the civics layer. The optional table of civics and their best servers holds the same data with one row per civic and server, which suits redundancy and failover analysis.\n\
         The resulting layers will contain tower features points, output civic points and spoke line connections showcasing the level of connectivity threshold for civics to their best servicing tower.\n\
         Unique Civic Identifier: The unique identifier for each of the features in the input civics layer such as Civic ID.\n\
         Network name: The network name of towers as created in CloudRF that is intended to be servicing the input civics layer.\n\
@@ -651,8 +3900,182 @@ class BestSignalProcessingAlgorithm(QgsProcessingAlgorithm):
         Receiver height: Height of the receiver at each civic location.\n\
         Antenna ID: Antenna code for tower mounted antenna model. (See cloudrf.com/api/antennas)\n\
         Raster resolution: Default is 30 meters, finer resolution is available from CloudRF depending on area of interest or can be provided to CloudRF for more refined calculations.\n\
-        NOTE: A folder of calculation data will be generated in the same directory as your 'Civics with signal strength data'. This folder of interim data is generate in the case that the processing algorithm may possibly crash for unexpected reasons as to not need to remake requests for data that has been acquired prior to a crash.\n\
+        Concurrent requests: Number of CloudRF best server requests kept in flight at the same time. Raise it to make use of the API capacity, lower it if the API starts rejecting requests.\n\
+        Requests per second: Upper limit on the request rate. The rate is reduced automatically while CloudRF throttles requests (HTTP 429) and recovers afterwards.\n\
+        Retries: Requests throttled by CloudRF or failing with a server or connection error are retried with exponential backoff, up to the per request limit and the total retry budget of the run. Civics that still fail are reported and left for the next run.\n\
+        Response cache: Valid CloudRF responses are cached, compressed in a single SQLite file, by a hash of the network, coordinates, receiver parameters and resolution, so a civic is only requested again when one of them changes. By default the cache is kept in a 'cloudrf_cache' folder next to the output civics and is shared by every run writing to that folder. Entries expire after the given number of days and the least recently used entries are removed once the cache exceeds its size limit. Responses kept in the checkpoint store of the data folder expire after the same number of days and are cleared along with the cache.\n\
+        Request civics sharing a grid cell only once: Civics are grouped on a grid of the given number of raster cells and one request is made for the centre of each cell, the answer is then used for every civic in the cell. This greatly reduces the number of requests for apartments, multipart features and duplicated addresses. The civic coordinates reported in the output are those of the cell centre.\n\
+        Incremental run: Only civics added, moved or otherwise changed since the previous run writing to the same data folder are requested and parsed. Unchanged civics reuse the results stored in the checkpoint store, civics removed from the input layer are dropped, and tower statistics and output layers are then rebuilt from the combined results.\n\
+        Pre-screen: Civics whose best signal is estimated well above the threshold, or well below the marginal band, are answered locally instead of by CloudRF. The estimate uses the towers and signals of the CloudRF responses stored in the data folder by previous runs, with the signal falling 20 dB for every tenfold distance from a tower (free space) or by a rate fitted on those signals (empirical). Only civics within the margin of the threshold or marginal band are requested. Estimated civics have no chart and are flagged in the _est field, and their results are kept apart from CloudRF responses.\n\
+        Chart images: Optionally downloads the path profile chart of every civic and server with the concurrent requests set above into a 'cloudrf_charts' folder next to the output civics. The chart url fields and map tips then point at the local copies, so browsing the results is instant and works offline. Charts are downloaded once per chart url and shared by every run writing to the folder, and the least recently used charts are removed once the cache exceeds its size limit. Charts of the current run are never removed while it runs, but charts pointed at by the outputs of earlier runs can be removed by a later run, after which the map tips of those outputs show no image. Raise the size limit to keep the charts of the outputs you keep.\n\
+        Tower registry: The towers of every response are kept in the checkpoint store of the network across runs, with a spatial index for nearest tower and radius queries. The pre-screen estimates each civic from its nearest registered towers. SciPy is used for the index when it is installed in the QGIS Python environment.\n\
+        Chunk size: Civics are read, requested, parsed and written this many at a time. Only the tower statistics are kept in memory for the whole layer and the civic results are read back from the checkpoint store while writing, so memory use stays flat for layers of millions of civics. 0 keeps every civic in memory, which is faster for smaller layers.\n\
+        Parsing worker processes: Number of processes parsing CloudRF responses in parallel. Worker processes are only used when the algorithm runs outside of the QGIS processing toolbox, otherwise responses are parsed in the QGIS process.\n\
+        Timeout: Seconds to wait for each CloudRF response before the request is treated as failed and retried. Connections to CloudRF are kept alive and reused for the whole run.\n\
+        The civics and towers are written straight into the output layers, the civics keep all of their input fields.\n\
+        Reprojection: Civic coordinates are reprojected to WGS84 in bulk as they are read from the input layer, with pyproj when it is installed in the QGIS Python environment and with a QGIS coordinate transform otherwise. No reprojected copy of the input layer is made.\n\
+        NOTE: A folder of calculation data will be generated in the same directory as your 'Civics with signal strength data'. Civics are streamed straight from the input layer to CloudRF and each response is parsed as it arrives. The raw and parsed responses are checkpointed in a single SQLite file in the data folder, and kept in the response cache, so requests for data that has been acquired prior to a crash are not remade.\n\
+        Run metrics: Optionally writes the time spent in each phase, a histogram of CloudRF response times, HTTP statuses, retries, the response cache hit ratio and the bytes sent and received, as JSON or as Prometheus text for a .prom file.\n\
+        Threshold sweep: Optionally compares the threshold with other thresholds without running the analysis again. The best signals stored by the run are classified against every threshold in one pass, giving a comparison table of the Good, Marginal and Bad connections and coverage at each threshold, the connection statistics of every tower at each threshold and optionally a copy of the civics layer styled at each of the other thresholds. Civics answered by the pre-screen keep their estimated signal. From the command line, --sweep runs the same comparison over the results of a previous run.\n\
+        Spatial indexes: Output layers whose format does not write a spatial index are indexed once written. The optional GeoPackage holds the civics, towers, spokes and server table with their styles and an R-tree index for every layer, in one file that is easy to share.\n\
+        Command line: The same analysis runs without QGIS, reading the civics from a GeoPackage layer or a CSV file of WGS84 coordinates and writing GeoJSON or CSV layers or, when GDAL is installed, a single GeoPackage of all layers with R-tree indexes or FlatGeobuf layers with a packed R-tree. Run this script with python and --help for its options.\n\
         UPDATE: August 16th, 2021: Add distance, azimuth, and downtilt between towers and civics.\n\
         For additional documentation:\n https://api.cloudrf.com\n https://github.com/Cloud-RF/CloudRF-API-clients\n\
         Created by: Stats Wong\n\
         Updated by: Kevin Chen")
+
+
+def main(argv=None):
+    """
+    Command line entry point running the analysis without QGIS, for example
+
+    python Best_RF_Signal_Analysis_API202.py civics.gpkg --civic-field OBJECTID --network LTE_Pictou --uid 123 --key abc
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description='Finds the best CloudRF tower for every civic point of a GeoPackage layer or CSV file and writes the civics, towers and spokes as GeoJSON or CSV.')
+    parser.add_argument('input', help='GeoPackage of civic points, reprojected with pyproj when not in WGS84, or CSV file of WGS84 civic points')
+    parser.add_argument('--layer', help='GeoPackage layer, the first point layer by default')
+    parser.add_argument('--x-field', default='lon', help='CSV longitude column (default: lon)')
+    parser.add_argument('--y-field', default='lat', help='CSV latitude column (default: lat)')
+    parser.add_argument('--civic-field', required=True, help='unique civic identifier field')
+    parser.add_argument('--network', required=True, nargs='+', help='CloudRF network name (i.e. LTE_Pictou), several networks are run as a batch and merged')
+    parser.add_argument('--shard-size', type=float, help='split the civics into square shards of this many degrees, run as a batch')
+    parser.add_argument('--jobs', type=int, default=4, help='networks and shards run in parallel by a batch (default: 4)')
+    parser.add_argument('--uid', required=True, help='CloudRF UserID')
+    parser.add_argument('--key', required=True, help='CloudRF API key')
+    parser.add_argument('--threshold', default='-65', help='threshold signal strength in dBm (default: -65)')
+    parser.add_argument('--rxh', default='', help='receiver height in metres above ground level')
+    parser.add_argument('--rxg', default='', help='receiver gain in dBi')
+    parser.add_argument('--res', default='30', help='raster resolution in metres (default: 30)')
+    parser.add_argument('--servers', type=int, default=2, help='number of best servers kept for each civic (default: 2)')
+    parser.add_argument('--output-folder', default='.', help='folder of the output files (default: current folder)')
+    parser.add_argument('--name', help='base name of the output files, the network name by default')
+    parser.add_argument('--format', choices=OutputLayers.FORMATS, default='geojson',
+                        help='output format, gpkg writes every layer into one GeoPackage with R-tree indexes, gpkg and fgb need GDAL (default: geojson)')
+    parser.add_argument('--server-table', action='store_true', help='also write the table of civics and their best servers')
+    parser.add_argument('--spokes-all-servers', action='store_true', help='draw spokes to all of the best servers of each civic')
+    parser.add_argument('--geodesic', action='store_true', help='draw spokes as great circle lines')
+    parser.add_argument('--server', default='https://cloudrf.com', help='CloudRF server (default: https://cloudrf.com)')
+    parser.add_argument('--insecure', action='store_true', help='do not verify the SSL certificate of the server')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent CloudRF requests (default: 4)')
+    parser.add_argument('--rate-limit', type=float, default=4.0, help='maximum requests per second, 0 for no limit (default: 4)')
+    parser.add_argument('--max-retries', type=int, default=5, help='retries per throttled or failed request (default: 5)')
+    parser.add_argument('--retry-budget', type=int, default=500, help='total retries allowed for the whole run (default: 500)')
+    parser.add_argument('--timeout', type=float, default=120.0, help='seconds to wait for each response (default: 120)')
+    parser.add_argument('--no-gzip', action='store_true', help='do not request gzip compressed responses')
+    parser.add_argument('--cache-folder', help='folder of cached responses, cloudrf_cache in the output folder by default')
+    parser.add_argument('--cache-ttl', type=float, default=30, help='days before a cached response expires, 0 to never expire (default: 30)')
+    parser.add_argument('--cache-size', type=float, default=1024, help='maximum size of the response cache in MB (default: 1024)')
+    parser.add_argument('--clear-cache', action='store_true', help='clear cached responses of the network before requesting')
+    parser.add_argument('--snap-cells', type=float, help='request civics sharing a grid cell of this many raster cells only once')
+    parser.add_argument('--incremental', action='store_true', help='only request civics added or changed since the previous run')
+    parser.add_argument('--parse-workers', type=int, default=1, help='worker processes parsing responses (default: 1)')
+    parser.add_argument('--chunk-size', type=int, help='process and write the civics this many at a time to bound memory use')
+    parser.add_argument('--prefetch-charts', action='store_true', help='download the chart images to a local cache and point the url fields at the local copies')
+    parser.add_argument('--chart-cache-size', type=float, default=512, help='maximum size of the chart image cache in MB, charts of earlier outputs may be removed past it (default: 512)')
+    parser.add_argument('--prescreen', choices=('empirical', 'free-space'), help='estimate clearly good or bad civics locally with a path loss model fitted on previous runs')
+    parser.add_argument('--prescreen-margin', type=float, default=10.0, help='dB between an estimate and the threshold or marginal band to skip CloudRF (default: 10)')
+    parser.add_argument('--sweep', type=float, nargs='+', metavar='THRESHOLD',
+                        help='instead of a run, compare these thresholds in dBm over the results stored by the previous run, without requests')
+    parser.add_argument('--sweep-styles', action='store_true', help='also write a style of the civics layer classified at each sweep threshold, for single network runs')
+    parser.add_argument('--metrics', help='write the run metrics to this JSON file, or as Prometheus text to a .prom file')
+    args = parser.parse_args(argv)
+    if args.format in ('gpkg', 'fgb') and ogr is None:
+        parser.error('--format {} needs the GDAL Python bindings (osgeo), as installed with QGIS'.format(args.format))
+    snap_m = float(args.res)*args.snap_cells if args.snap_cells else None
+    prescreen = args.prescreen.replace('-', '_') if args.prescreen else None
+    metrics = PipelineMetrics()
+
+    # A sweep reclassifies the results stored by the previous run
+    if args.sweep:
+        batch = len(args.network) > 1 or args.shard_size
+        name = args.name or ('batch' if batch else args.network[0])
+        try:
+            paths = run_sweep(args.output_folder, name, args.network, args.sweep, os.path.join(args.output_folder, '{}_data'.format(name)), args.format,
+                              args.sweep_styles and not batch)
+        except ValueError as error:
+            parser.error(str(error))
+        for path in dict.fromkeys(paths.values()):
+            print('Wrote {}'.format(path), file=sys.stderr)
+        return 0
+
+    # Several networks or a sharded layer are run as a batch and merged
+    if len(args.network) > 1 or args.shard_size:
+        try:
+            paths = run_batch(args.input, args.civic_field, args.network, args.uid, args.key, args.output_folder, args.name or 'batch', args.layer,
+                              args.x_field, args.y_field, args.threshold, args.rxh, args.rxg, args.res, args.shard_size, args.jobs, args.concurrency,
+                              args.rate_limit, args.format, server=args.server, strict_ssl=not args.insecure, top_n=args.servers,
+                              max_retries=args.max_retries, retry_budget=args.retry_budget, timeout=args.timeout, gzip=not args.no_gzip,
+                              cache_folder=args.cache_folder, cache_ttl=args.cache_ttl, cache_size=args.cache_size, clear_cache=args.clear_cache,
+                              snap_m=snap_m, incremental=args.incremental, parse_workers=args.parse_workers, metrics=metrics,
+                              prescreen=prescreen, prescreen_margin=args.prescreen_margin)
+        except KeyboardInterrupt:
+            return 1
+        if paths is None:
+            return 1
+        metrics.lap('write')
+        if args.metrics:
+            metrics.report(args.metrics)
+        for path in dict.fromkeys(paths.values()):
+            print('Wrote {}'.format(path), file=sys.stderr)
+        return 0
+
+    args.network = args.network[0]
+    name = args.name or args.network
+    total = sum(1 for point in read_points(args.input, args.civic_field, args.layer, args.x_field, args.y_field)[1])
+    field_names, points = read_points(args.input, args.civic_field, args.layer, args.x_field, args.y_field)
+    feedback = ConsoleFeedback(total)
+    fingerprints = {}
+    civic_rows = iter_point_rows(points, args.uid, args.key, args.rxh, args.rxg, args.network, fingerprints)
+    data_folder = os.path.join(args.output_folder, '{}_data'.format(name))
+
+    # Chunked runs only keep the tower aggregates in memory and read the
+    # civic results back from the checkpoint store as they are written
+    towers = TowerAggregates()
+
+    def add_chunk(chunk_results):
+        towers.add(chunk_results, classify_signals(chunk_results.column('signal'), args.threshold))
+
+    try:
+        signal_results = best_signal_analysis(civic_rows, fingerprints, args.network, args.res, data_folder, args.server, not args.insecure, args.servers,
+                                              args.concurrency, args.rate_limit, args.max_retries, args.retry_budget, args.timeout, not args.no_gzip,
+                                              args.cache_folder, args.cache_ttl, args.cache_size, args.clear_cache, snap_m, args.incremental, args.parse_workers,
+                                              feedback, total, feedback.setCurrentStep, metrics=metrics, chunk_size=args.chunk_size,
+                                              on_chunk=add_chunk if args.chunk_size else None, t_dbm=args.threshold,
+                                              prescreen=prescreen, prescreen_margin=args.prescreen_margin)
+    except KeyboardInterrupt:
+        feedback.pushInfo('Canceled, requests received so far are kept in the checkpoint store')
+        return 1
+    if signal_results is None:
+        return 1
+
+    metrics.lap()
+    charts = None
+    if args.prefetch_charts:
+        charts = ChartCache(os.path.join(args.output_folder, 'cloudrf_charts'), args.chart_cache_size, args.concurrency, args.rate_limit, args.timeout, not args.insecure)
+    summary = summarize_results(signal_results, data_folder, args.network, args.servers, args.threshold, towers if args.chunk_size else None,
+                                charts, feedback, metrics)
+    metrics.lap('aggregate')
+    field_names, points = read_points(args.input, args.civic_field, args.layer, args.x_field, args.y_field)
+    try:
+        paths = write_outputs(points, field_names, args.civic_field, args.network, summary, args.output_folder, name, args.format,
+                              args.spokes_all_servers, args.geodesic, args.server_table, args.chunk_size or 1000)
+    finally:
+        if args.chunk_size:
+            summary.close()
+        if charts is not None:
+            charts.close()
+    if charts is not None:
+        feedback.pushInfo('Chart images: {} downloaded, {} failed'.format(charts.downloaded, charts.failed))
+    metrics.lap('write')
+    if args.metrics:
+        metrics.report(args.metrics)
+    good, marginal, bad = summary.towers.totals()
+    feedback.pushInfo('{} good, {} marginal and {} bad connections out of {} civics'.format(good, marginal, bad, total))
+    for path in dict.fromkeys(paths.values()):
+        feedback.pushInfo('Wrote {}'.format(path))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+## End to end throughput benchmark of Best_RF_Signal_Analysis_API202.py
+## against the local mock CloudRF server
+##
+## python benchmark.py --sizes 1000 10000 100000 --concurrency 16
+##
+## Every size runs in its own process, and the mock server in another, so the
+## peak RSS reported is that of the pipeline for the size alone. Results are
+## printed as a table and optionally written as JSON.
+
+import argparse, csv, importlib.util, json, os, random, re, requests, resource, sqlite3, subprocess, sys, tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, 'Best_RF_Signal_Analysis_API202.py')
+MOCK = os.path.join(HERE, 'cloudrf_mock_server.py')
+
+
+def load_analysis():
+    spec = importlib.util.spec_from_file_location('Best_RF_Signal_Analysis_API202', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_civics(path, size, seed=1):
+    """
+    Writes a synthetic civic layer of size random points over Nova Scotia.
+    """
+    generator = random.Random(seed)
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['OBJECTID', 'civic_no', 'lon', 'lat'])
+        for index in range(size):
+            writer.writerow([index+1, generator.randint(1, 9999), round(generator.uniform(-66.3, -59.9), 6), round(generator.uniform(43.5, 47.0), 6)])
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/(1024*1024) if sys.platform == 'darwin' else peak/1024
+
+
+def start_mock(args):
+    """
+    Starts the mock server in its own process on a free port, so neither its
+    memory nor its threads are counted in the measurements, and returns the
+    process and the server URL.
+    """
+    command = [sys.executable, MOCK, '--port', '0', '--latency', str(args.latency), '--error-rate', str(args.error_rate),
+               '--throttle-rate', str(args.throttle_rate), '--towers', str(args.towers), '--seed', '1']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, cwd=HERE)
+    line = process.stdout.readline().decode('utf-8')
+    match = re.search(r'http://[\d.]+:\d+', line)
+    if match is None:
+        process.kill()
+        raise RuntimeError('The mock server did not start: {}'.format(line))
+    return process, match.group(0)
+
+
+def run_one(args):
+    """
+    Runs the pipeline once on a synthetic layer of args.size civics and returns
+    the measurements. The phase timings are those of PipelineMetrics, the
+    request phase includes parsing the responses as they arrive.
+    """
+    analysis = load_analysis()
+    metrics = analysis.PipelineMetrics()
+    process, url = start_mock(args)
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'civics.csv')
+            with metrics.phase('generate'):
+                write_civics(path, args.size)
+
+            field_names, points = analysis.read_points(path, 'OBJECTID')
+            fingerprints = {}
+            civic_rows = analysis.iter_point_rows(points, '1', 'key', '', '', 'LTE_Bench', fingerprints)
+            feedback = analysis.ConsoleFeedback(stream=open(os.devnull, 'w'))
+            signal_results = analysis.best_signal_analysis(civic_rows, fingerprints, 'LTE_Bench', '30', os.path.join(folder, 'data'), url, True, args.servers,
+                                                           args.concurrency, args.rate_limit, timeout=30, parse_workers=args.parse_workers,
+                                                           feedback=feedback, total=args.size, metrics=metrics)
+
+            # Parsing is measured again on its own over the stored responses
+            responses = [body for body, in sqlite3.connect(os.path.join(folder, 'data', 'LTE_Bench_best_signal.sqlite')).execute('SELECT body FROM responses')]
+            with metrics.phase('reparse'):
+                analysis.parse_responses(responses, 'LTE_Bench', args.servers)
+
+            with metrics.phase('aggregate'):
+                summary = analysis.BestSignalSummary(signal_results, '-90')
+
+            with metrics.phase('write'):
+                field_names, points = analysis.read_points(path, 'OBJECTID')
+                analysis.write_outputs(points, field_names, 'OBJECTID', 'LTE_Bench', summary, folder, 'bench')
+        stats = requests.get('{}/stats'.format(url), timeout=10).json()
+    finally:
+        process.terminate()
+        process.wait()
+    snapshot = metrics.snapshot()
+    timings = snapshot['phases_s']
+    return {
+        'size': args.size,
+        'requests': stats['requests'],
+        'throttled': stats['throttled'],
+        'errors': stats['errors'],
+        'requests_per_s': stats['requests']/timings['request'],
+        'parse_rows_per_s': len(responses)/timings['reparse'] if timings['reparse'] else None,
+        'civics': len(signal_results),
+        'peak_rss_mb': peak_rss_mb(),
+        'timings': timings,
+        'counters': snapshot['counters']
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the best signal analysis against a local mock CloudRF server.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='numbers of synthetic civics (default: 1000 10000 100000)')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent requests (default: 16)')
+    parser.add_argument('--rate-limit', type=float, default=0, help='requests per second, 0 for no limit (default: 0)')
+    parser.add_argument('--parse-workers', type=int, default=1, help='worker processes parsing responses (default: 1)')
+    parser.add_argument('--servers', type=int, default=2, help='best servers kept per civic (default: 2)')
+    parser.add_argument('--latency', type=float, default=0.02, help='mean mock response time in seconds (default: 0.02)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of mock HTTP 500 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of mock HTTP 429 responses')
+    parser.add_argument('--towers', type=int, default=400, help='towers in the mock network (default: 400)')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.size:
+        print(json.dumps(run_one(args)))
+        return 0
+
+    results = []
+    for size in args.sizes:
+        command = [sys.executable, os.path.abspath(__file__), '--size', str(size)]
+        for name in ('concurrency', 'rate_limit', 'parse_workers', 'servers', 'latency', 'error_rate', 'throttle_rate', 'towers'):
+            command.extend(['--{}'.format(name.replace('_', '-')), str(getattr(args, name))])
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, cwd=HERE).stdout
+        results.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+
+    phases = ('request', 'parse', 'reparse', 'aggregate', 'write')
+    print('{:>8} {:>9} {:>10} {:>13} {:>9} '.format('civics', 'requests', 'req/s', 'parse rows/s', 'peak MB')+' '.join('{:>13}'.format(phase) for phase in phases))
+    for result in results:
+        print('{size:>8} {requests:>9} {requests_per_s:>10.1f} {parse_rows_per_s:>13.0f} {peak_rss_mb:>9.1f} '.format(**result)
+              +' '.join('{:>12.2f}s'.format(result['timings'].get(phase, 0.0)) for phase in phases))
+    if args.json:
+        with open(args.json, 'w') as jsonfile:
+            json.dump(results, jsonfile, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
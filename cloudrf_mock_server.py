@@ -0,0 +1,213 @@
+## Local stand-in for the CloudRF best server API used to measure and tune
+## Best_RF_Signal_Analysis_API202.py without spending API credits
+##
+## python cloudrf_mock_server.py --port 8765 --latency 0.05 --error-rate 0.01 --throttle-rate 0.01
+##
+## then run the analysis against it with --server http://127.0.0.1:8765. With
+## --port 0 a free port is used, the URL is printed on the first line. GET
+## /stats returns the request, throttle and error counts as JSON.
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+import argparse, gzip, hashlib, json, math, random, threading, time
+
+# A 1x1 transparent PNG served for every chart image
+CHART_IMAGE = bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+                            '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082')
+
+
+class MockOptions:
+    """
+    Behaviour of the mock server. latency is the mean response time in seconds,
+    error_rate and throttle_rate the fractions of requests answered with HTTP
+    500 and 429, max_rate the requests per second above which requests are
+    answered with 429 (0 for no limit) and towers the number of towers laid out
+    on a grid over the area of interest.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.5, error_rate=0.0, throttle_rate=0.0, max_rate=0.0, retry_after=1,
+                 towers=400, servers=5, bbox=(-66.5, 43.4, -59.7, 47.1), seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self.servers = servers
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = []
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+        # Towers are laid out on a square grid with a random offset each so the
+        # closest towers of neighbouring civics overlap as in a real network
+        side = max(1, int(math.ceil(math.sqrt(towers))))
+        min_lon, min_lat, max_lon, max_lat = bbox
+        self.towers = []
+        for index in range(towers):
+            row, col = divmod(index, side)
+            lon = min_lon+(col+self.random.random())*(max_lon-min_lon)/side
+            lat = min_lat+(row+self.random.random())*(max_lat-min_lat)/side
+            self.towers.append(('Tower_{}'.format(index+1), lon, lat, self.random.choice((30, 45, 60, 90))))
+
+    def outcome(self):
+        """
+        Returns the HTTP status for the next request.
+        """
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            if self.max_rate > 0:
+                self.window = [when for when in self.window if when > now-1]
+                if len(self.window) >= self.max_rate:
+                    self.throttled += 1
+                    return 429
+                self.window.append(now)
+            draw = self.random.random()
+            if draw < self.throttle_rate:
+                self.throttled += 1
+                return 429
+            if draw < self.throttle_rate+self.error_rate:
+                self.errors += 1
+                return 500
+            return 200
+
+    def delay(self):
+        with self.lock:
+            return max(0.0, self.random.uniform(1-self.jitter, 1+self.jitter)*self.latency)
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2-phi1)/2)**2+math.cos(phi1)*math.cos(phi2)*math.sin(math.radians(lon2-lon1)/2)**2
+    return 2*6371.0088*math.asin(min(1, math.sqrt(a)))
+
+
+def bearing_deg(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dlon = math.radians(lon2-lon1)
+    y = math.sin(dlon)*math.cos(phi2)
+    x = math.cos(phi1)*math.sin(phi2)-math.sin(phi1)*math.cos(phi2)*math.cos(dlon)
+    return math.degrees(math.atan2(y, x)) % 360
+
+
+def best_server_response(options, form, host):
+    """
+    Returns the best server response for a request, the closest towers of the
+    network with a free-space signal, an antenna and terrain loss and a
+    deterministic clutter term, in the layout returned by CloudRF.
+    """
+    lat = float(form.get('lat', '0'))
+    lon = float(form.get('lon', '0'))
+    network = form.get('net', 'NETWORK')
+    uid = form.get('uid', '0')
+    rxh = float(form.get('rxh') or 2)
+    closest = sorted(options.towers, key=lambda tower: (tower[2]-lat)**2+((tower[1]-lon)*math.cos(math.radians(lat)))**2)[:options.servers]
+    servers = []
+    for name, tower_lon, tower_lat, height in closest:
+        distance = max(distance_km(lat, lon, tower_lat, tower_lon), 0.01)
+        clutter = int(hashlib.sha1('{:.5f}{:.5f}{}'.format(lat, lon, name).encode('utf-8')).hexdigest()[:4], 16)/65535*20
+        signal = round(43-(20*math.log10(distance)+20*math.log10(700)+32.44)+15-clutter, 1)
+        chart = hashlib.md5('{}{}{}'.format(lat, lon, name).encode('utf-8')).hexdigest()
+        servers.append({
+            'Server name': '{}_{}_{}'.format(uid, network, name),
+            'Chart image': 'http://{}/API/archive/data/{}.png'.format(host, chart),
+            'Receiver': [{'Latitude': lat, 'Longitude': lon, 'Antenna height m': rxh}],
+            'Transmitters': [{
+                'Latitude': tower_lat,
+                'Longitude': tower_lon,
+                'Antenna height m': height,
+                'Signal power at receiver dBm': signal,
+                'Distance to receiver km': round(distance, 3),
+                'Azimuth to receiver deg': round(bearing_deg(tower_lat, tower_lon, lat, lon), 1),
+                'Downtilt angle deg': round(math.degrees(math.atan2(height-rxh, distance*1000)), 2)
+            }]
+        })
+    return servers
+
+
+class MockCloudRFHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and content_type == 'application/json':
+            body = gzip.compress(body, 1)
+            headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        options = self.server.options
+        length = int(self.headers.get('Content-Length', 0))
+        form = {name: values[0] for name, values in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+        time.sleep(options.delay())
+        status = options.outcome()
+        if status == 429:
+            self.send_body(429, b'{"error": "Too many requests"}', headers={'Retry-After': str(options.retry_after)})
+        elif status != 200:
+            self.send_body(status, b'{"error": "Internal server error"}')
+        else:
+            self.send_body(200, json.dumps(best_server_response(options, form, self.headers.get('Host', 'localhost'))).encode('utf-8'))
+
+    def do_GET(self):
+        options = self.server.options
+        if self.path == '/stats':
+            self.send_body(200, json.dumps({'requests': options.requests, 'throttled': options.throttled, 'errors': options.errors}).encode('utf-8'))
+            return
+        time.sleep(options.delay())
+        if self.path.endswith('.png'):
+            self.send_body(200, CHART_IMAGE, 'image/png')
+        else:
+            self.send_body(404, b'')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(port=0, options=None):
+    """
+    Starts the mock server in a background thread and returns the server, its
+    URL is 'http://127.0.0.1:{}'.format(server.server_port). Call shutdown() on
+    the server to stop it.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockCloudRFHandler)
+    server.daemon_threads = True
+    server.options = options or MockOptions()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for the CloudRF best server API.')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on, 0 for a free port (default: 8765)')
+    parser.add_argument('--latency', type=float, default=0.05, help='mean response time in seconds (default: 0.05)')
+    parser.add_argument('--jitter', type=float, default=0.5, help='relative spread of the response time (default: 0.5)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with HTTP 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of requests answered with HTTP 429')
+    parser.add_argument('--max-rate', type=float, default=0.0, help='requests per second above which HTTP 429 is returned')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with HTTP 429 (default: 1)')
+    parser.add_argument('--towers', type=int, default=400, help='number of towers in the network (default: 400)')
+    parser.add_argument('--seed', type=int, help='random seed')
+    args = parser.parse_args(argv)
+    options = MockOptions(args.latency, args.jitter, args.error_rate, args.throttle_rate, args.max_rate, args.retry_after, args.towers, seed=args.seed)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), MockCloudRFHandler)
+    server.daemon_threads = True
+    server.options = options
+    print('Mock CloudRF server listening on http://127.0.0.1:{}'.format(server.server_port), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('{} requests, {} throttled, {} errors'.format(options.requests, options.throttled, options.errors))
+
+
+if __name__ == '__main__':
+    main()